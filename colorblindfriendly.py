@@ -29,10 +29,15 @@ DESCRIPTION
 
 USAGE
 
-    import colorblindfriendly
+    run colorblindfriendly.py
     color myObject, cb_red
     color mySel, cb_yellow
 
+    or from python:
+
+    import colorblindfriendly
+    colorblindfriendly.set_colors()
+
 REQUIREMENTS
 
     None.
@@ -93,12 +98,23 @@ cb_colors = (
      ("reddishpurple", "rose", "violet", "magenta")),
 )
 
-for c in cb_colors:
-    # main name
-    cmd.set_color("cb_%s" % c[0], c[1])
-    print("Set color: cb_%s" % c[0])
 
-    # alternate names
-    for alt in c[2]:
-        cmd.set_color("cb_%s" % alt, c[1])
-        # print("           cb_%s" % alt)
+def set_colors(quiet=1):
+    '''
+    register all palette colors and their alternate names
+    '''
+    for c in cb_colors:
+        # main name
+        cmd.set_color("cb_%s" % c[0], c[1])
+        if not int(quiet):
+            print("Set color: cb_%s" % c[0])
+
+        # alternate names
+        for alt in c[2]:
+            cmd.set_color("cb_%s" % alt, c[1])
+            # print("           cb_%s" % alt)
+
+
+# imported as module the colors are registered by the caller, e.g. palette.register_palette
+if __name__ != "colorblindfriendly":
+    set_colors(quiet=0)
@@ -0,0 +1,145 @@
+'''
+Distance table of the ligand and its environment.
+
+The binding site radius of the advanced mode ranges from 4.0 to 6.0 A. It is
+the cutoff of all polarpairs queries of the pipeline, so instead of searching
+pairs again for every radius, the table holds every residue within
+MAX_RADIUS of the ligand, the distance of each of its atoms to the closest
+ligand atom and all donor acceptor pairs among these atoms and the ligand up to
+MAX_RADIUS, with their distances. Any radius up to MAX_RADIUS is answered by
+filtering: the polarpairs queries of InteractionContext.prime_table and the
+per radius summary written with --output_radius_table.
+
+Atoms are identified by (resi, resn, chain, name, alt) instead of object and
+index, so the table also answers queries on copies like binding_site and can be
+cached on disk, see contact_cache_key.
+
+Example usage:
+
+table = ContactTable.compute("ligand", "protein_structure")
+context.prime_table(table)
+lines = table.radius_table_lines("LIG")
+
+'''
+import hashlib
+import json
+import math
+
+from pymol import cmd
+
+from output_writer import atomic_open, file_checksum
+
+# largest binding site radius offered by the advanced mode
+MAX_RADIUS = 6.0
+# radii of the per radius summary
+ALL_RADII = (4.0, 4.5, 5.0, 5.5, 6.0)
+# version of the cached json, increase when its content changes
+CACHE_VERSION = 1
+
+
+def distance(xyz1, xyz2):
+    return math.sqrt(sum([(c1 - c2) ** 2 for c1, c2 in zip(xyz1, xyz2)]))
+
+
+def contact_cache_key(input_filename, *settings):
+    '''
+    file name of a cached table, from the checksum of the input and the settings which change the table
+    '''
+    key = "|".join([str(CACHE_VERSION), file_checksum(input_filename)] + [str(setting) for setting in settings])
+    return "%s.json" % hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ContactTable(object):
+    '''
+    atoms: distance to the closest ligand atom of every environment atom
+    ligand_atoms: atoms of the ligand
+    pairs: (donor, acceptor, distance) up to max_radius, found with angle in state
+    '''
+
+    def __init__(self, atoms, ligand_atoms, pairs, max_radius=MAX_RADIUS, angle=63.0, state=1):
+        self.atoms = atoms
+        self.ligand_atoms = ligand_atoms
+        self.pairs = pairs
+        self.max_radius = max_radius
+        self.angle = angle
+        self.state = state
+
+    @classmethod
+    def compute(cls, ligand="ligand", environment="protein_structure", max_radius=MAX_RADIUS, angle=63.0, state=1):
+        '''
+        residues of environment within max_radius of ligand, one iterate and one find_pairs
+        '''
+        selection = "(byres ((%s) within %s of (%s))) or (%s)" % (environment, max_radius, ligand, ligand)
+        coordinates = {}
+        cmd.iterate_state(state, selection, 'coordinates[(model, index)] = ((resi, resn, chain, name, alt), (x, y, z))',
+                          space={'coordinates': coordinates})
+        ligand_indices = set(cmd.index(ligand))
+        ligand_xyz = [coordinates[atom][1] for atom in ligand_indices]
+        ligand_atoms = set([coordinates[atom][0] for atom in ligand_indices])
+
+        atoms = {}
+        for key, xyz in coordinates.values():
+            # the ligand is a copy, its original atoms in environment share the keys
+            if key not in ligand_atoms and key not in atoms:
+                atoms[key] = min([distance(xyz, ligand_coordinate) for ligand_coordinate in ligand_xyz])
+
+        mode = 1 if angle > 0 else 0
+        pairs = set()
+        for donor, acceptor in cmd.find_pairs('(%s) and donors' % selection, '(%s) and acceptors' % selection,
+                                              state, state, cutoff=max_radius, mode=mode, angle=angle):
+            (donor_key, donor_xyz), (acceptor_key, acceptor_xyz) = coordinates[donor], coordinates[acceptor]
+            if donor_key != acceptor_key:
+                pairs.add((donor_key, acceptor_key, distance(donor_xyz, acceptor_xyz)))
+        return cls(atoms, ligand_atoms, sorted(pairs), max_radius, angle, state)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fh:
+            table = json.load(fh)
+        return cls(dict([(tuple(key), distance_to_ligand) for key, distance_to_ligand in table["atoms"]]),
+                   set([tuple(key) for key in table["ligand_atoms"]]),
+                   [(tuple(donor), tuple(acceptor), pair_distance) for donor, acceptor, pair_distance in table["pairs"]],
+                   table["max_radius"], table["angle"], table["state"])
+
+    def save(self, path):
+        with atomic_open(path) as fh:
+            json.dump({"atoms": sorted(self.atoms.items()), "ligand_atoms": sorted(self.ligand_atoms),
+                       "pairs": self.pairs, "max_radius": self.max_radius, "angle": self.angle,
+                       "state": self.state}, fh)
+
+    def covers(self, keys, cutoff, angle, state):
+        '''
+        True if pairs between keys within cutoff can be answered from the table
+        '''
+        return cutoff <= self.max_radius and (angle, state) == (self.angle, self.state) and \
+            all([key in self.atoms or key in self.ligand_atoms for key in keys])
+
+    def pairs_between(self, keys1, keys2, cutoff):
+        '''
+        donor acceptor pairs between keys1 and keys2 within cutoff in both directions, the keys1 atom first
+        '''
+        pairs = [pair for pair in self.pairs if pair[2] <= cutoff]
+        return [(donor, acceptor) for donor, acceptor, pair_distance in pairs if donor in keys1 and acceptor in keys2] + \
+               [(acceptor, donor) for donor, acceptor, pair_distance in pairs if acceptor in keys1 and donor in keys2]
+
+    def radius_table_lines(self, ligand_name, radii=ALL_RADII):
+        '''
+        tab separated residues of the binding site per radius, closest distance to the ligand
+        and number of polar contacts with the ligand at that radius
+        '''
+        residues = {}
+        for key, distance_to_ligand in self.atoms.items():
+            residue = key[:3]
+            residues[residue] = min(distance_to_ligand, residues.get(residue, distance_to_ligand))
+
+        lines = ["#BINDING SITE OF %s PER RADIUS\n" % ligand_name,
+                 "RADIUS\tRESI\tRESN\tCHAIN\tDISTANCE\tPOLAR_CONTACTS\n"]
+        for radius in radii:
+            contacts = {}
+            for atom, partner in self.pairs_between(set(self.atoms), self.ligand_atoms, radius):
+                contacts[atom[:3]] = contacts.get(atom[:3], 0) + 1
+            for residue, distance_to_ligand in sorted(residues.items(), key=lambda item: (item[1], item[0])):
+                if distance_to_ligand <= radius:
+                    lines.append("%s\t%s\t%s\t%s\t%.2f\t%s\n" % ((radius,) + residue +
+                                                                (distance_to_ligand, contacts.get(residue, 0))))
+        return lines
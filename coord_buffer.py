@@ -0,0 +1,253 @@
+'''
+Coordinate buffer of a loaded structure, shared between processes.
+
+The analysis process writes coordinates, atom attributes, interaction flags
+and bonds of the structure once into a single file, by default in /dev/shm.
+Analysis and render workers on the same node map the file instead of loading
+and parsing the pdb file again, all workers share the same pages of memory.
+
+Layout, all numbers in the byte order given in the header:
+
+    magic       8 bytes, MAGIC
+    length      uint32, length of the header
+    header      json: number of atoms and bonds, string tables and the offset of every array
+    coords      float32, x y z per atom
+    elem, resn, resi, chain, name, alt, segi, ss
+                uint32 per atom, index into the string table of the column
+    b, q        float32 per atom
+    flags       uint8 per atom, bits of FLAGS, interaction flags and hetatm
+    bonds       uint32, two atom indices per bond
+    bond_order  uint8 per bond
+
+Arrays start at multiples of 8 bytes. With numpy the arrays are views of the
+mapped file, without numpy memoryviews (python 3) or copies (python 2).
+
+The buffer outlives the job that wrote it, the workers map it afterwards. The
+caller of --export_coordinate_buffer owns the file (its path is listed in the
+manifest as coordinate_buffer) and removes it once the workers are done, a
+buffer left in /dev/shm keeps its memory until the node reboots. Workers which
+still map it keep their pages after the removal.
+
+Example usage:
+
+# analysis process, pymol
+export_coordinate_buffer("1abc", default_buffer_path("1abc.mmcb"), flag_keys)
+# any worker on the node
+buffer = CoordinateBuffer("/dev/shm/1abc.mmcb")
+donors = buffer.flags & FLAGS["donor"]
+buffer.load("1abc")
+buffer.close()
+# caller, after all workers are done
+os.remove("/dev/shm/1abc.mmcb")
+
+'''
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b"MMCOORD1"
+VERSION = 2
+STRING_COLUMNS = ("elem", "resn", "resi", "chain", "name", "alt", "segi", "ss")
+FLOAT_COLUMNS = ("b", "q")
+FLAGS = {"donor": 1, "acceptor": 2, "polar": 4, "water_bridge": 8, "halogen": 16, "binding_site": 32, "ligand": 64,
+         "hetatm": 128}
+# array typecode, numpy dtype and bytes per item of the arrays
+TYPES = {"f": ("float32", 4), "I": ("uint32", 4), "B": ("uint8", 1)}
+
+
+def default_buffer_path(filename):
+    '''
+    filename in /dev/shm, memory backed and shared between processes, or in the temporary directory
+    '''
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, filename)
+
+
+def _to_bytes(values):
+    return values.tobytes() if hasattr(values, "tobytes") else values.tostring()
+
+
+def write_coordinate_buffer(path, coords, columns, flags, bonds, bond_orders, source=""):
+    '''
+    coords: x y z per atom, columns: value per atom for each of STRING_COLUMNS and FLOAT_COLUMNS,
+    flags: int per atom, bonds: (atom index, atom index) per bond
+    '''
+    # imported here, output_writer needs pymol and attaching to a buffer does not
+    from output_writer import atomic_open
+
+    arrays = [("coords", "f", [c for xyz in coords for c in xyz])]
+    string_tables = {}
+    for column in STRING_COLUMNS:
+        table = {}
+        indices = [table.setdefault(value, len(table)) for value in columns[column]]
+        string_tables[column] = sorted(table, key=table.get)
+        arrays.append((column, "I", indices))
+    for column in FLOAT_COLUMNS:
+        arrays.append((column, "f", columns[column]))
+    arrays.append(("flags", "B", flags))
+    arrays.append(("bonds", "I", [index for bond in bonds for index in bond]))
+    arrays.append(("bond_order", "B", bond_orders))
+
+    data = [(name, array.array(typecode, values)) for name, typecode, values in arrays]
+    for name, values in data:
+        if values.itemsize != TYPES[values.typecode][1]:
+            raise TypeError("array '%s' has %s bytes per item instead of %s" % (name, values.itemsize, TYPES[values.typecode][1]))
+
+    header = {"version": VERSION, "byteorder": sys.byteorder, "atoms": len(coords), "bonds": len(bonds),
+              "source": source, "flags": FLAGS, "strings": string_tables, "arrays": {}}
+    # offsets depend on the length of the header, which contains them, reserve enough digits
+    offset = 0
+    for name, values in data:
+        header["arrays"][name] = [offset, values.typecode, len(values)]
+        offset += (len(values) * values.itemsize + 7) // 8 * 8
+    header_length = len(json.dumps(header)) + 16 * len(data)
+    start = (len(MAGIC) + 4 + header_length + 7) // 8 * 8
+    for name in header["arrays"]:
+        header["arrays"][name][0] += start
+    header_bytes = json.dumps(header).encode("utf-8").ljust(start - len(MAGIC) - 4)
+
+    with atomic_open(path, "wb") as fh:
+        fh.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for name, values in data:
+            raw = _to_bytes(values)
+            fh.write(raw + b"\0" * ((8 - len(raw) % 8) % 8))
+    return len(coords)
+
+
+def export_coordinate_buffer(selection, path, flag_keys=None, state=1):
+    '''
+    write the atoms of selection to a coordinate buffer at path, returns the number of atoms
+    flag_keys: atom keys (resi, resn, chain, name) per name of FLAGS, donors and acceptors are typed here
+    '''
+    from pymol import cmd
+
+    flag_keys = dict(flag_keys or {})
+    for kind in ["donor", "acceptor"]:
+        keys = set()
+        cmd.iterate("(%s) and %ss" % (selection, kind), 'keys.add((resi, resn, chain, name))', space={'keys': keys})
+        flag_keys[kind] = keys
+
+    # one get_model for coordinates, attributes and bonds
+    model = cmd.get_model(selection, state=state)
+    columns = dict([(column, []) for column in STRING_COLUMNS + FLOAT_COLUMNS])
+    flags = []
+    for atom in model.atom:
+        for column, value in zip(STRING_COLUMNS + FLOAT_COLUMNS, (atom.symbol, atom.resn, atom.resi, atom.chain,
+                                                                  atom.name, atom.alt, atom.segi, atom.ss,
+                                                                  atom.b, atom.q)):
+            columns[column].append(value)
+        key = (atom.resi, atom.resn, atom.chain, atom.name)
+        flags.append(sum([bit for flag, bit in FLAGS.items() if key in flag_keys.get(flag, ())]) +
+                     (FLAGS["hetatm"] if atom.hetatm else 0))
+    bonds = [bond.index for bond in model.bond]
+    bond_orders = [bond.order for bond in model.bond]
+    return write_coordinate_buffer(path, [atom.coord for atom in model.atom], columns, flags, bonds, bond_orders,
+                                   source=selection)
+
+
+class CoordinateBuffer(object):
+    '''
+    read only view of a coordinate buffer, attributes coords, flags, bonds, bond_order, b, q and
+    one index array per string column, strings maps a column to its string table
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise IOError("'%s' is not a coordinate buffer" % path)
+        header_length = struct.unpack("<I", self._map[len(MAGIC):len(MAGIC) + 4])[0]
+        self.header = json.loads(self._map[len(MAGIC) + 4:len(MAGIC) + 4 + header_length].decode("utf-8"))
+        if self.header["version"] != VERSION:
+            raise IOError("coordinate buffer '%s' has version %s instead of %s" % (path, self.header["version"], VERSION))
+        if self.header["byteorder"] != sys.byteorder:
+            raise IOError("coordinate buffer '%s' was written with byte order %s" % (path, self.header["byteorder"]))
+        self.atoms = self.header["atoms"]
+        self.strings = self.header["strings"]
+        for name, (offset, typecode, count) in self.header["arrays"].items():
+            setattr(self, name, self._array(offset, typecode, count))
+        if numpy is not None:
+            self.coords = self.coords.reshape((self.atoms, 3))
+
+    def _array(self, offset, typecode, count):
+        dtype, itemsize = TYPES[typecode]
+        if numpy is not None:
+            return numpy.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+        raw = self._map[offset:offset + count * itemsize] if sys.version_info[0] < 3 else \
+            memoryview(self._map)[offset:offset + count * itemsize]
+        if hasattr(raw, "cast"):
+            return raw.cast(typecode)
+        # python 2 without numpy, copy
+        values = array.array(typecode)
+        values.fromstring(raw)
+        return values
+
+    def value(self, column, atom_index):
+        return str(self.strings[column][getattr(self, column)[atom_index]])
+
+    def xyz(self, atom_index):
+        if numpy is not None:
+            return [float(c) for c in self.coords[atom_index]]
+        return [float(c) for c in self.coords[3 * atom_index:3 * atom_index + 3]]
+
+    def to_model(self):
+        '''
+        chempy model of the buffer, for cmd.load_model
+        '''
+        from chempy import models, Atom, Bond
+
+        model = models.Indexed()
+        for atom_index in range(self.atoms):
+            atom = Atom()
+            atom.symbol, atom.resn, atom.resi, atom.chain, atom.name, atom.alt, atom.segi, atom.ss = \
+                [self.value(column, atom_index) for column in STRING_COLUMNS]
+            atom.b, atom.q = [float(getattr(self, column)[atom_index]) for column in FLOAT_COLUMNS]
+            atom.hetatm = 1 if self.flags[atom_index] & FLAGS["hetatm"] else 0
+            atom.coord = self.xyz(atom_index)
+            model.add_atom(atom)
+        for bond_index in range(self.header["bonds"]):
+            bond = Bond()
+            bond.index = [int(self.bonds[2 * bond_index]), int(self.bonds[2 * bond_index + 1])]
+            bond.order = int(self.bond_order[bond_index])
+            model.add_bond(bond)
+        return model
+
+    def load(self, name, template=""):
+        '''
+        load the buffer as object name, returns the number of atoms
+        atoms, attributes and bonds are copied from the object template (default name), only the coordinates
+        are pushed with cmd.load_coords. the template is built with to_model when it does not exist yet, after
+        that loading another buffer of the same structure, e.g. the next pose or frame, costs a copy at most
+        '''
+        from pymol import cmd
+
+        template = template or name
+        if template not in cmd.get_names("objects"):
+            cmd.load_model(self.to_model(), template)
+            if template == name:
+                return self.atoms
+        elif cmd.count_atoms(template) != self.atoms:
+            raise ValueError("template '%s' has %s atoms, the buffer '%s' %s" % (template, cmd.count_atoms(template),
+                                                                               self.path, self.atoms))
+        if template != name:
+            cmd.delete(name)
+            cmd.create(name, template)
+        coords = self.coords if numpy is not None else [self.xyz(atom_index) for atom_index in range(self.atoms)]
+        cmd.load_coords(coords, name)
+        return self.atoms
+
+    def close(self):
+        # views on the map have to be released before it can be closed
+        for name in self.header["arrays"]:
+            setattr(self, name, None)
+        self._map.close()
@@ -0,0 +1,81 @@
+'''
+Benchmark of loading a structure from a coordinate buffer against cmd.load.
+
+Exports the structure to a coordinate buffer in /dev/shm and reports the best
+of several runs, in milliseconds, for:
+
+    cmd.load        parsing the structure file
+    to_model        cmd.load_model of CoordinateBuffer.to_model, atom by atom
+    load_first      CoordinateBuffer.load without template, builds it with to_model
+    load_copy       CoordinateBuffer.load as a copy of an existing template
+    load_in_place   CoordinateBuffer.load into the template, only the coordinates
+
+Every variant is checked to give the coordinates of the structure.
+MOVIEMAKERPATH and PYTHONPATH have to be set like in the movie_maker_*.sh scripts.
+
+Example usage:
+
+pymol -cq coord_buffer_benchmark.py -- --input regression/1hpv.pdb --repeats 20
+
+'''
+from __future__ import print_function
+import argparse
+import os
+import time
+
+from pymol import cmd
+
+from coord_buffer import CoordinateBuffer, export_coordinate_buffer, default_buffer_path
+
+
+def best_of(function, repeats, setup=None):
+    '''
+    shortest runtime of function in milliseconds, setup runs untimed before every call
+    '''
+    seconds = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.time()
+        function()
+        seconds.append(time.time() - start)
+    return min(seconds) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loading from a coordinate buffer against cmd.load")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    cmd.load(args.input, "structure")
+    expected = cmd.get_coords("structure")
+    buffer_path = default_buffer_path("coord_buffer_benchmark_%s.mmcb" % os.getpid())
+    export_coordinate_buffer("structure", buffer_path)
+    cmd.delete("all")
+    buffer = CoordinateBuffer(buffer_path)
+    try:
+        timings = [
+            ("cmd.load", best_of(lambda: cmd.load(args.input, "loaded"), args.repeats,
+                                 lambda: cmd.delete("loaded"))),
+            ("to_model", best_of(lambda: cmd.load_model(buffer.to_model(), "loaded"), args.repeats,
+                                 lambda: cmd.delete("loaded"))),
+            ("load_first", best_of(lambda: buffer.load("loaded"), args.repeats, lambda: cmd.delete("loaded"))),
+            ("load_copy", best_of(lambda: buffer.load("loaded", template="template"), args.repeats,
+                                  lambda: buffer.load("template"))),
+            ("load_in_place", best_of(lambda: buffer.load("template"), args.repeats)),
+        ]
+        for name in ["loaded", "template"]:
+            if abs(cmd.get_coords(name) - expected).max() > 1e-3:
+                raise RuntimeError("coordinates of %s differ from %s" % (name, args.input))
+    finally:
+        buffer.close()
+        os.remove(buffer_path)
+
+    print("%s, %s atoms, best of %s runs" % (args.input, cmd.count_atoms("template"), args.repeats))
+    reference = timings[0][1]
+    for name, milliseconds in timings:
+        print("%-14s %8.2f ms  %6.2fx cmd.load" % (name, milliseconds, milliseconds / reference))
+
+
+main()
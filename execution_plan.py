@@ -0,0 +1,117 @@
+'''
+Resource guard of the movie maker.
+
+Right after loading, the size of the input is measured and memory and runtime
+of the pipeline are estimated from per stage costs. If the estimate exceeds the
+configured limits, the pipeline is degraded step by step until it fits:
+
+    skip_surface              no surface of the whole protein
+    restrict_to_ligand_chain  remove all chains but the chain of the ligand
+    cap_waters                analyse at most max_waters water molecules
+    short_movie               shorter movie, all segments scaled by movie_frame_scale
+
+The per stage costs are rough defaults, estimated orders of magnitude and not
+calibrated measurements, so the limits only protect against structures that are
+far too large. To calibrate them for a server, run typical structures with
+--log_level debug, divide the seconds of each stage in the log by its units
+(atoms, pocket atoms, waters or frames, listed in the "plan" event) and the
+peak memory by the atoms, and pass the values as json file with the same
+structure as DEFAULT_COST_MODEL to --cost_model.
+
+'''
+import json
+
+DEFAULT_COST_MODEL = {
+    # loaded structure, atom info and coordinates
+    "structure": {"mb_per_unit": 0.0005, "seconds_per_unit": 0.00002},
+    # surface of the whole protein
+    "surface": {"mb_per_unit": 0.006, "seconds_per_unit": 0.0004},
+    # protein_cartoon and its two transparent copies, cost per copy
+    "cartoon": {"mb_per_unit": 0.0007, "seconds_per_unit": 0.00001},
+    # binding site selections, polar pairs and halogen bonds
+    "pocket": {"mb_per_unit": 0.002, "seconds_per_unit": 0.001},
+    # water bridge prediction, per water molecule in the binding site
+    "water": {"mb_per_unit": 0.05, "seconds_per_unit": 0.05},
+    # movie frames and stored views
+    "movie": {"mb_per_unit": 0.002, "seconds_per_unit": 0.002},
+}
+
+DEGRADATIONS = ("skip_surface", "restrict_to_ligand_chain", "cap_waters", "short_movie")
+
+# number of cartoon objects created from the whole protein
+CARTOON_COPIES = 3
+
+
+def load_cost_model(path=""):
+    cost_model = dict(DEFAULT_COST_MODEL)
+    if path:
+        with open(path) as fh:
+            cost_model.update(json.load(fh))
+    return cost_model
+
+
+def estimate(plan, cost_model):
+    '''
+    estimated memory in MB and runtime in seconds of a plan
+    '''
+    units = {
+        "structure": plan["atoms"],
+        "surface": plan["atoms"] if plan["surface"] else 0,
+        "cartoon": CARTOON_COPIES * plan["atoms"],
+        "pocket": plan["pocket_atoms"],
+        "water": plan["waters"],
+        "movie": int(plan["frames"] * plan["movie_frame_scale"]),
+    }
+    memory_mb = sum([cost_model[name]["mb_per_unit"] * number for name, number in units.items()])
+    seconds = sum([cost_model[name]["seconds_per_unit"] * number for name, number in units.items()])
+    return memory_mb, seconds
+
+
+def plan_execution(counts, max_memory_mb, max_runtime_seconds, cost_model=None,
+                   max_waters=10, movie_frame_scale=0.5):
+    '''
+    counts: atoms, ligand_chain_atoms, pocket_atoms, waters and frames of the input
+    returns the plan with the applied degradations, its estimate and the limits
+    '''
+    cost_model = cost_model or DEFAULT_COST_MODEL
+    plan = {
+        "atoms": counts["atoms"],
+        "pocket_atoms": counts["pocket_atoms"],
+        "waters": counts["waters"],
+        "frames": counts["frames"],
+        "surface": True,
+        "restrict_to_ligand_chain": False,
+        "max_waters": 0,
+        "movie_frame_scale": 1.0,
+        "degradations": [],
+    }
+
+    def fits():
+        memory_mb, seconds = estimate(plan, cost_model)
+        return memory_mb <= max_memory_mb and seconds <= max_runtime_seconds
+
+    for degradation in DEGRADATIONS:
+        if fits():
+            break
+        if degradation == "skip_surface":
+            plan["surface"] = False
+        elif degradation == "restrict_to_ligand_chain":
+            if counts["ligand_chain_atoms"] >= plan["atoms"]:
+                continue
+            plan["restrict_to_ligand_chain"] = True
+            plan["atoms"] = counts["ligand_chain_atoms"]
+        elif degradation == "cap_waters":
+            if plan["waters"] <= max_waters:
+                continue
+            plan["max_waters"] = max_waters
+            plan["waters"] = max_waters
+        elif degradation == "short_movie":
+            plan["movie_frame_scale"] = movie_frame_scale
+        plan["degradations"].append(degradation)
+
+    memory_mb, seconds = estimate(plan, cost_model)
+    plan["estimated_memory_mb"] = round(memory_mb, 1)
+    plan["estimated_seconds"] = round(seconds, 1)
+    plan["fits_limits"] = fits()
+    plan["limits"] = {"max_memory_mb": max_memory_mb, "max_runtime_seconds": max_runtime_seconds}
+    return plan
@@ -0,0 +1,79 @@
+'''
+Logging of the movie maker.
+
+Three levels are available:
+
+    quiet  warnings and errors only (default)
+    info   one summary line per stage
+    debug  additionally structured json events with stage, counts and timings
+
+Each job logs to its own file, hot loops only count and report a summary
+once they are done.
+
+Example usage:
+
+setup_logging("debug", "movie_maker.log")
+with stage("selections") as counts:
+    counts["polar_pairs"] = len(pairs)
+
+'''
+from contextlib import contextmanager
+import json
+import logging
+import time
+
+logger = logging.getLogger("movie_maker")
+
+LOG_LEVELS = {"quiet": logging.WARNING, "info": logging.INFO, "debug": logging.DEBUG}
+
+
+class JsonEventFormatter(logging.Formatter):
+    '''
+    one json object per line, fields of log_event are merged into it
+    '''
+
+    def format(self, record):
+        event = {"time": round(record.created, 3), "level": record.levelname, "message": record.getMessage()}
+        event.update(getattr(record, "event", {}))
+        return json.dumps(event, sort_keys=True)
+
+
+def setup_logging(level="quiet", log_file=""):
+    '''
+    log to log_file, or stderr if not given, replaces handlers of a previous setup
+    '''
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    if level == "debug":
+        handler.setFormatter(JsonEventFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVELS.get(level, logging.WARNING))
+    # do not pass records on to the root logger of the pymol process
+    logger.propagate = False
+
+
+def log_event(stage_name, message="", **fields):
+    '''
+    structured event, only formatted and written at debug level
+    '''
+    if logger.isEnabledFor(logging.DEBUG):
+        fields["stage"] = stage_name
+        logger.debug(message or stage_name, extra={"event": fields})
+
+
+@contextmanager
+def stage(stage_name):
+    '''
+    time a stage of the pipeline, counts added to the yielded dict are reported with it
+    '''
+    counts = {}
+    start = time.time()
+    yield counts
+    seconds = time.time() - start
+    logger.info("%s done in %.2fs %s", stage_name, seconds,
+                " ".join("%s=%s" % item for item in sorted(counts.items())))
+    log_event(stage_name, "stage done", seconds=round(seconds, 3), **counts)
@@ -25,12 +25,19 @@ from pymol import cmd
 import argparse  # library for parsing commandline parameters
 from sys import argv
 import os
+import re
 from string import ascii_uppercase
 # methods are only available over cmd.do when not importing polar_pairs
 #   , this makes passing of variables complicated
 #   we rely on the correct setting of the PYTHONPATH environment variable,
 #   to include the directory in which polar_pairs.py resides
-from polar_pairs import polarpairs, polartuples
+from polar_pairs import polarpairs, polartuples, atom_keys, InteractionContext
+from palette import register_palette, load_theme, color_by_element
+from job_log import logger, log_event, setup_logging, stage, LOG_LEVELS
+from execution_plan import plan_execution, load_cost_model
+from output_writer import OutputWriter, atomic_open, zstandard, SESSION_COMPRESSIONS
+from contact_table import ContactTable, contact_cache_key, MAX_RADIUS
+from coord_buffer import export_coordinate_buffer, default_buffer_path
 
 
 #PATH TO CURRENT DIRECTORY
@@ -38,6 +45,10 @@ MOVIE_MAKER_PATH = os.environ.get('MOVIEMAKERPATH')
 POLAR_INTERACTIONS_FILENAME = os.environ.get('POLAR_INTERACTION_FILENAME')
 MOVIE_SCRIPT_FILENAME = os.environ.get('MOVIE_SCRIPT_FILENAME')
 SESSION_NAME = "basic_movie.pse"
+# length of the movie with polar interactions and halogen bonds
+MAX_MOVIE_FRAMES = 2100
+# width and height of the thumbnail written in the preview phase
+PREVIEW_IMAGE_SIZE = (320, 240)
 
 cmd.reinitialize()
 
@@ -48,16 +59,11 @@ cmd.do("run %spolar_pairs.py"% (MOVIE_MAKER_PATH, ))
 
 valid_amino_acid_3letter_codes = set("ALA CYS ASP GLU PHE GLY HIS ILE LYS LEU MET ASN PRO GLN ARG SER THR VAL TRP TYR WAT SUL HEM".split(" "))
 
-def parse_commandline_options():
-
-    # passed filename is first passed argument, but flags are also in argv
-    print("python file loaded")
-    for i, ele in enumerate(argv):
-        print("argv[%s]" % i, ele)
+def parse_commandline_options(args=None):
 
     parser = argparse.ArgumentParser(description="Trying to parse some named parameters from shellscript")
     # parser.add_argument("-i", "--input", required=True)
-    parser.add_argument("-i", "--input", required=True)
+    parser.add_argument("-i", "--input")
     # parser.add_argument("--ligand_name", required=True)
     parser.add_argument("--ligand_name", type=str)
     parser.add_argument("--chain_name", type=str, default="A")
@@ -70,15 +76,41 @@ def parse_commandline_options():
     parser.add_argument("--color_polar_interactions", type=str, default="blue")
     parser.add_argument("--cofactor_name", type=str, default="")
     parser.add_argument("--color_carbon_cofactor", type=str, default="orange")
+    parser.add_argument("--preview_image", type=str, default="")
+    parser.add_argument("--preview_session", type=str, default="")
+    parser.add_argument("--output_session", type=str, default=SESSION_NAME)
+    parser.add_argument("--output_polar_interactions", type=str, default=POLAR_INTERACTIONS_FILENAME)
+    parser.add_argument("--output_movie_script", type=str, default=MOVIE_SCRIPT_FILENAME)
+    parser.add_argument("--output_manifest", type=str, default="")
+    parser.add_argument("--session_compression", type=str, default="none")
+    parser.add_argument("--color_theme", type=str, default="")
+    parser.add_argument("--log_level", type=str, default="quiet", choices=sorted(LOG_LEVELS))
+    parser.add_argument("--log_file", type=str, default="")
+    parser.add_argument("--batch_manifest", type=str, default="")
+    parser.add_argument("--batch_ligand_table", type=str, default="")
+    parser.add_argument("--batch_output_dir", type=str, default=".")
+    parser.add_argument("--batch_pending_writes", type=int, default=2)
+    parser.add_argument("--max_memory_mb", type=float, default=float(os.environ.get('MOVIE_MAKER_MAX_MEMORY_MB', 8192)))
+    parser.add_argument("--max_runtime", type=float, default=float(os.environ.get('MOVIE_MAKER_MAX_RUNTIME', 3600)))
+    parser.add_argument("--cost_model", type=str, default="")
+    parser.add_argument("--pocket_shell", type=str, default="none", choices=["none", "residues", "chains"])
+    parser.add_argument("--pocket_radius", type=float, default=10.0)
+    parser.add_argument("--output_radius_table", type=str, default="")
+    parser.add_argument("--contact_cache_dir", type=str, default=os.environ.get('MOVIE_MAKER_CONTACT_CACHE', ""))
+    parser.add_argument("--export_coordinate_buffer", type=str, default="")
     # parser.add_argument("--", required=True)
-    args = parser.parse_args()
+    args = parser.parse_args(args)
     options = vars(args)  # put variables into dictionary
-    if args.input:
-        if os.path.exists(args.input):
-            input = args.input
-            # Parse commandline arguments
-            PDB_NAME = input.split(".")[0]
-            PDB_FILENAME = PDB_NAME + ".pdb"
+    setup_logging(args.log_level, args.log_file)
+    # passed filename is first passed argument, but flags are also in argv
+    log_event("arguments", argv=argv)
+    if not args.input and not args.batch_manifest:
+        parser.error("either --input or --batch_manifest is required")
+    if args.input and not args.batch_manifest:
+        if not args.output_movie_script:
+            parser.error("no path for the movie script, pass --output_movie_script or set environment variable MOVIE_SCRIPT_FILENAME.")
+        if not args.output_polar_interactions:
+            parser.error("no path for the polar interactions, pass --output_polar_interactions or set environment variable POLAR_INTERACTION_FILENAME.")
 
     # option for super basic mode
     if not args.ligand_name:
@@ -132,6 +164,17 @@ def parse_commandline_options():
     # set session_export to be of desired version
     cmd.set("pse_export_version", session_version)
 
+    # compression of the session while it is written, see output_writer
+    session_compression = "none"
+    if args.session_compression in SESSION_COMPRESSIONS:
+        session_compression = args.session_compression
+    if session_compression == "zstd" and zstandard is None:
+        raise ImportError("zstd session compression needs the zstandard package, use gzip or no compression instead.")
+    if session_compression != "none" and session_version < 1.84:
+        # legacy targets predate loading of *.pse.gz, the session has to be decompressed before loading
+        logger.info("Session for pymol %s is compressed, decompress it before loading", session_version)
+    options["session_compression"] = session_compression
+
     # --cofactor_name ${12} - -color_carbon_cofactor
     if args.cofactor_name:
         options['cofactor_in_binding_site'] = True
@@ -140,13 +183,26 @@ def parse_commandline_options():
     else:
         options['cofactor_in_binding_site'] = False
 
+    return options
+
+
+def load_structure(input):
     # load pdb file (first argument)
-    # renaming the *.dat file to *.pdb, loading with pymol and renaming for galaxy
-    os.rename(input, PDB_FILENAME)
-    cmd.load(PDB_FILENAME)
-    os.rename(PDB_FILENAME, input) # rename back to *.dat
+    # galaxy passes *.dat files, the format is given explicitly instead of renaming the dataset,
+    # which other jobs may read at the same time
+    cmd.load(input, format="pdb")
 
-    return options
+
+def reset_session():
+    '''
+    remove objects, views and movie of the previous structure, keeps settings and registered colors
+    scenes are kept, create_views stores over them. pymol 3.2 double frees memory if a scene is deleted
+    before its thumbnail is rendered, see output_writer.get_session
+    '''
+    cmd.delete("all")
+    cmd.view("*", action="clear")
+    cmd.mset()
+    cmd.frame(1)
 
 
 def apply_color_switch(commandline_options):
@@ -156,10 +212,8 @@ def apply_color_switch(commandline_options):
     if cofactor_selected:
         cofactor_color = commandline_options['color_carbon_cofactor']
 
-    # import color settings
-    cmd.do("run %scolorblindfriendly.py" % MOVIE_MAKER_PATH)
-    # hotpink rgb: 255, 105, 180
-    cmd.set_color("hot_pink", (255.0/255.0, 105.0/255.0, 180.0/255.0))
+    # import color settings, registered only once per process
+    register_palette()
 
     if color_blind_save_selected:
         color_dict['protein_surface'] = "cb_sky_blue"
@@ -203,6 +257,9 @@ def apply_settings(cmd_options):
     # Colors
     color_dict = apply_color_switch(cmd_options)
     color_dict["color_carbon"] = cmd_options["color_carbon"]
+    if cmd_options["color_theme"]:
+        # user defined theme overrides the colors of the selected scheme
+        color_dict.update(load_theme(cmd_options["color_theme"]))
 
     settings_dict["colors"] = color_dict
     settings_dict["cartoon_transparency"] = 0.6
@@ -213,7 +270,7 @@ def apply_settings(cmd_options):
     return settings_dict
 
 
-def create_selections(options):
+def resolve_ligand(options):
 
     # Hide everything
     cmd.hide("lines")
@@ -222,9 +279,9 @@ def create_selections(options):
     # Protein structure
     cmd.select("protein_structure", "all")
 
-    if options.has_key('no_ligand_selected'):
+    if 'no_ligand_selected' in options:
         # Super basic option, call ligand and chain from organic
-        print("Attempting to automatically find ligand")
+        logger.info("Attempting to automatically find ligand")
         ligand_candidates_number = cmd.select("ligand_candidate", "organic")
         candidate_resn = ""
         candidate_chain = ""
@@ -234,7 +291,7 @@ def create_selections(options):
                 candidate_resn, candidate_chain = cand_atom.resn, cand_atom.chain
                 break;
         if candidate_resn and candidate_chain:
-            print("Automatically detected ligand is '%s' in chain '%s'" % (candidate_resn, candidate_chain))
+            logger.info("Automatically detected ligand is '%s' in chain '%s'", candidate_resn, candidate_chain)
             options['ligand_name'] = candidate_resn
             options['chain_name'] = candidate_chain
         else:
@@ -246,6 +303,8 @@ def create_selections(options):
     # remove all duplicate conformations
     cmd.remove("sele_all_ligands and not sele_ligand")
     cmd.delete("sele_all_ligands")
+    # cached donor/acceptor typing and pairs refer to the removed atoms
+    options['interaction_context'].invalidate()
 
     #Feature: If we did not get a correct chain name from the user, we will try to guess through the whole alphabet to find it
     # otherwise the ligand will not appear in the visualization
@@ -260,30 +319,168 @@ def create_selections(options):
     cmd.create("ligand", "sele_ligand")
     cmd.delete("sele_ligand")
     cmd.show("sticks", "ligand")
-    cmd.color(options["colors"]['color_carbon'], "ligand and e. C")
-    cmd.color(options["colors"]['oxygen'], "ligand and e. O")
-    cmd.color(options["colors"]['nitrogen'], "ligand and e. N")
+    color_by_element("ligand", options["colors"]['color_carbon'], options["colors"]['nitrogen'], options["colors"]['oxygen'])
+
+
+def extract_pocket(options):
+    '''
+    pocket-only mode for huge structures: ligand environment, residues or whole chains
+    within pocket_radius, is copied into the object pocket and the full structure is deleted
+    the pocket pipeline runs on pocket, F1 to F3 use the low detail CA trace protein_context
+    '''
+    shell = "bychain" if options['pocket_shell'] == "chains" else "byres"
+    loaded_objects = cmd.get_object_list("protein_structure")
+    cmd.create("pocket", "%s (protein_structure within %s of ligand)" % (shell, options['pocket_radius']))
+    cmd.create("protein_context", "protein_structure and polymer and name CA")
+    for loaded_object in loaded_objects:
+        cmd.delete(loaded_object)
+    cmd.select("protein_structure", "pocket")
+    options['structure_objects'] = ["pocket"]
+    options['pocket_only'] = True
+    options['interaction_context'].invalidate()
+    log_event("pocket", shell=options['pocket_shell'], radius=options['pocket_radius'],
+              pocket_atoms=cmd.count_atoms("pocket"), context_atoms=cmd.count_atoms("protein_context"))
+
+
+def plan_resources(options):
+    '''
+    measure the input as soon as the ligand is known and degrade the pipeline to fit
+    the memory and runtime limits, see execution_plan
+    '''
+    radius = options['binding_site_radius']
+    counts = {
+        "atoms": cmd.count_atoms("protein_structure"),
+        "ligand_chain_atoms": cmd.count_atoms("protein_structure and chain %s" % options['chain_name']),
+        "pocket_atoms": cmd.count_atoms("protein_structure within %s of ligand" % radius),
+        "waters": 0,
+        "frames": MAX_MOVIE_FRAMES,
+    }
+    if options['water_in_binding_site']:
+        counts["waters"] = cmd.count_atoms("(protein_structure and resn hoh) within %s of ligand" % radius)
+
+    plan = plan_execution(counts, options['max_memory_mb'], options['max_runtime'],
+                          cost_model=load_cost_model(options['cost_model']))
+    options['execution_plan'] = plan
+    options['skip_surface'] = not plan['surface']
+    options['max_waters'] = plan['max_waters']
+    options['movie_frame_scale'] = plan['movie_frame_scale']
+    if plan['restrict_to_ligand_chain']:
+        cmd.remove("protein_structure and not chain %s" % options['chain_name'])
+        options['interaction_context'].invalidate()
+
+    log_event("plan", counts=counts, **plan)
+    if plan['degradations']:
+        logger.warning("Structure exceeds the limits, applied degradations: %s", ", ".join(plan['degradations']))
+    if not plan['fits_limits']:
+        logger.warning("Estimated %s MB and %s s exceed the limits even after all degradations",
+                       plan['estimated_memory_mb'], plan['estimated_seconds'])
+
+
+def compute_contacts(options):
+    '''
+    distance table of ligand and environment up to MAX_RADIUS, see contact_table
+    the polar pairs of every radius up to MAX_RADIUS are answered from it
+    '''
+    max_radius = max(MAX_RADIUS, options['binding_site_radius'])
+    cache_path = ""
+    if options['contact_cache_dir']:
+        # everything that changes the atoms around the ligand is part of the key
+        cache_path = os.path.join(options['contact_cache_dir'], contact_cache_key(
+            options['input'], options['ligand_name'], options['chain_name'], max_radius,
+            options['pocket_shell'], options['pocket_radius'],
+            options['execution_plan']['restrict_to_ligand_chain']))
+    cached = bool(cache_path) and os.path.exists(cache_path)
+    if cached:
+        table = ContactTable.load(cache_path)
+        logger.info("Contact table loaded from %s", cache_path)
+    else:
+        table = ContactTable.compute("ligand", "protein_structure", max_radius)
+        if cache_path:
+            table.save(cache_path)
+    options['contact_table'] = table
+    options['interaction_context'].prime_table(table)
+    log_event("contacts", atoms=len(table.atoms), pairs=len(table.pairs), max_radius=max_radius, cached=cached)
+
+
+def create_preview(options, writer, label_prefix=""):
+    '''
+    phase one of the two phase execution: a cartoon-only draft of F5 and F6,
+    saved as thumbnail and draft session before surface, waters and halogens are computed
+    '''
+    cmd.create("preview_cartoon", "protein_structure and polymer")
+    cmd.hide("everything", "preview_cartoon")
+    cmd.show("cartoon", "preview_cartoon")
+    cmd.color(options["colors"]['protein_cartoon'], "preview_cartoon")
+
+    # side chains around the ligand, same radius as the binding site of phase two
+    cmd.create("preview_binding_site", "br. (protein_structure within %s of ligand) and not resn hoh" % (options['binding_site_radius'],))
+    cmd.hide("everything", "preview_binding_site")
+    cmd.show("sticks", "preview_binding_site")
+    color_by_element("preview_binding_site", options["colors"]['binding_site'], options["colors"]['nitrogen'], options["colors"]['oxygen'])
+
+    # draft F5, ligand with cartoon protein
+    cmd.disable("all")
+    cmd.enable("preview_cartoon")
+    cmd.enable("ligand")
+    cmd.orient("ligand")
+    cmd.zoom("preview_binding_site", 5)
+    cmd.scene("F5", action="store")
+
+    # draft F6, ligand and residues in radius of binding site
+    cmd.enable("preview_binding_site")
+    cmd.zoom("preview_binding_site", 2)
+    cmd.scene("F6", action="store")
+
+    if options['preview_image']:
+        # pymol appends .png to the galaxy *.dat filename, so render next to it and rename
+        image_filename = "%s.png" % options['preview_image']
+        # raytrace, there is no OpenGL context when running with pymol -c
+        cmd.png(image_filename, width=PREVIEW_IMAGE_SIZE[0], height=PREVIEW_IMAGE_SIZE[1], ray=1)
+        os.rename(image_filename, options['preview_image'])
+        writer.register(label_prefix + "preview_image", options['preview_image'])
+    if options['preview_session']:
+        writer.submit_session(options['preview_session'], label=label_prefix + "preview_session")
+
+    # phase two stores F5 and F6 again, which replaces the drafts. a deleted scene whose thumbnail
+    # pymol 3.2 did not render yet is freed twice, the job then crashes at exit
+    cmd.delete("preview_cartoon")
+    cmd.delete("preview_binding_site")
+    cmd.enable("all")
+
+
+def create_selections(options):
 
     # Cofactor
     if options["cofactor_in_binding_site"]:
         cmd.select("sele_cofactor", "resn %s and chain %s" % (options['cofactor_name'], options['chain_name']))
         cmd.create("cofactor", "sele_cofactor")
         cmd.show("sticks", "cofactor")
-        cmd.color(options['colors']['color_cofactor'], "cofactor and e. C")
+        color_by_element("cofactor", options['colors']['color_cofactor'])
         cmd.delete("sele_cofactor")
 
     # Surface
-    cmd.create("protein_surface", "all")
+    if options.get('pocket_only'):
+        # coarse surface around the CA trace, enlarged radii close the gaps between the CA atoms
+        cmd.create("protein_surface", "protein_context")
+        cmd.alter("protein_surface", "vdw = 3.0")
+        cmd.set("surface_quality", -1, "protein_surface")
+    else:
+        cmd.create("protein_surface", "all")
     cmd.hide("lines", "protein_surface")
     cmd.hide("sticks", "protein_surface")
     cmd.hide("nonbonded", "protein_surface")
-    cmd.show("surface", "protein_surface")
+    # the resource guard may skip the surface of huge structures, F1 and F2 then show the cartoon
+    if not options.get('skip_surface'):
+        cmd.show("surface", "protein_surface")
     cmd.color(options["colors"]['protein_surface'], "protein_surface")
 
     # Cartoon
     cmd.copy("protein_cartoon", "protein_surface")
     cmd.hide("surface", "protein_cartoon")
     cmd.show("cartoon", "protein_cartoon")
+    if options.get('pocket_only'):
+        # cartoon from the CA trace only
+        cmd.set("cartoon_trace_atoms", 1, "protein_cartoon")
     cmd.color(options["colors"]['protein_cartoon'], "protein_cartoon")
 
     # Transparent Cartoon
@@ -306,92 +503,94 @@ def create_selections(options):
     cmd.hide("nonbonded")
     cmd.show("sticks", "binding_site")
     cmd.show("nb_spheres", "binding_site and not resn HOH")
-    cmd.color(options["colors"]['binding_site'], "binding_site and e. C")
-    cmd.color(options["colors"]['nitrogen'], "binding_site and e. N")
-    cmd.color(options["colors"]['oxygen'], "binding_site and e. O")
+    color_by_element("binding_site", options["colors"]['binding_site'], options["colors"]['nitrogen'], options["colors"]['oxygen'])
+
+    # all polarpairs queries below are within binding site and ligand, answered from the contact table
+    context = options['interaction_context']
 
     # get polar interacting residues in binding site without water
     cmd.select("sele_no_water_binding_site", "binding_site and not resn hoh")
     cmd.select("sele_no_water_binding_site", "sele_no_water_binding_site and not resn %s" % options['ligand_name'])
-    pairs = polarpairs("sele_no_water_binding_site", "ligand", cutoff=options['binding_site_radius'], name="polar_int_d")
+    pairs = polarpairs("sele_no_water_binding_site", "ligand", cutoff=options['binding_site_radius'], name="polar_int_d", context=context)
     if pairs:
         cmd.hide("labels", "polar_int_d")
         cmd.color(options['colors']["interaction_polar"], "polar_int_d")
     else:
-        print("No polar interaction pairs found")
+        logger.info("No polar interaction pairs found")
         options["no_polar_interactions_found"] = True
     cmd.delete("sele_no_water_binding_site")
 
     interacting_tuples = polartuples(pairs, selection_name="polar_interaction")
 
+    # raw analysis results, compared against snapshots by regression_suite
+    analysis = {"polar_pairs": pairs, "polar_residues": interacting_tuples, "water_bridges": [], "halogen_bonds": []}
+    options["analysis"] = analysis
+
     #create a list with selection names of polar_interacting residues
     polar_selection_names = ["resi %s and resn %s and chain %s" % tup for tup in interacting_tuples]
 
-    # write the residues into a custom text file,
-    with open("%s" % (POLAR_INTERACTIONS_FILENAME, ), "w") as f:
-        f.write("#POLAR INTERACTION PARTNERS WITH %s\n" % (options['ligand_name'],))
-        f.write("RESI\tRESN\tCHAIN\n")
-        for tup in interacting_tuples:
-            f.write("%s\t%s\t%s\n" % tup)
+    # collect the residues for the custom text file, written once the analysis is done
+    polar_interaction_lines = ["#POLAR INTERACTION PARTNERS WITH %s\n" % (options['ligand_name'],)]
+    polar_interaction_lines.append("RESI\tRESN\tCHAIN\n")
+    for tup in interacting_tuples:
+        polar_interaction_lines.append("%s\t%s\t%s\n" % tup)
+    options["polar_interaction_lines"] = polar_interaction_lines
 
     #select all polar interacting residues at once for an overview
     # cmd.select("polar_interacting_residues", "")
     for i, selection_name in enumerate(polar_selection_names):
         if i:  # if i>0 and we already have sele_polar_interacting_residues
             cmd.select("sele_polar_interacting_residues", "sele_polar_interacting_residues or %s" % selection_name)
-            print("select sele_polar_interacting_residues, sele_polar_interacting_residues or %s" % selection_name)
         else:
             cmd.select("sele_polar_interacting_residues", selection_name)
-            print("select sele_polar_interacting_residues, %s" % selection_name)
+    log_event("polar_interactions", polar_pairs=len(pairs), residues=len(interacting_tuples))
 
-    if not options.has_key("no_polar_interactions_found"):
+    if "no_polar_interactions_found" not in options:
         cmd.create("polar_interacting_residues", "sele_polar_interacting_residues")
         cmd.delete("sele_polar_interacting_residues")
 
         cmd.show("sticks", "polar_interacting_residues")
-        cmd.color("grey50", "polar_interacting_residues and e. C")
-        cmd.color(options["colors"]['nitrogen'], "polar_interacting_residues and e. N")
-        cmd.color(options["colors"]['oxygen'], "polar_interacting_residues and e. O")
+        color_by_element("polar_interacting_residues", "grey50", options["colors"]['nitrogen'], options["colors"]['oxygen'])
 
 
     # create selection for HOH molecules in binding pocket and make nb_spheres
     if options['water_in_binding_site']:
         cmd.select("sele_water_binding_site", "binding_site and resn hoh")
-        water_pairs = polarpairs("sele_water_binding_site", "ligand", cutoff=options['binding_site_radius'])
+        water_pairs = polarpairs("sele_water_binding_site", "ligand", cutoff=options['binding_site_radius'], context=context)
 
         # further filter polar interactions, discard water molecules that don't interact with binding site and ligand
         # water molecules in interacting tuples are already forming a hbond to ligand
         water_list = []
         water_distance_list = []
         water_polar_tuples_list = []
+        water_pairs_list = []
 
         if water_pairs:
-            # print("water_bridge_candidates ", water_bridge_candidates)
-            print("water_bridge_candidates ", water_pairs)
             # water_bridge_selection_names = ["resi %s and resn %s and chain %s and polar_interacting_residues" % tup for
-            water_bridge_selection_names = ["(%s`%s)" % tup[0] for
-                                            tup in water_pairs]
+            # one entry per water, a water in contact with several ligand atoms appears in several pairs
+            water_bridge_selection_names = []
+            for tup in water_pairs:
+                if "(%s`%s)" % tup[0] not in water_bridge_selection_names:
+                    water_bridge_selection_names.append("(%s`%s)" % tup[0])
+            if options.get('max_waters'):
+                # capped by the resource guard
+                water_bridge_selection_names = water_bridge_selection_names[:options['max_waters']]
             for i, water_selection_name in enumerate(water_bridge_selection_names):
-                print("Water bridge prediction \n")
-                print("select sele_water%s, %s" % (i, water_selection_name))
                 water_selection = cmd.select("sele_water%s" % i, water_selection_name)
-                print("water selection has %s atoms" % water_selection)
                 cmd.select("sele_water_partner%s"%i, "sele_water%s expand %s" % (i, options['binding_site_radius']))
                 cmd.select("sele_water_partner%s"%i, "sele_water_partner%s and binding_site" %i)
                 cmd.select("sele_water_partner%s"%i, "sele_water_partner%s and not ligand" %i)
                 possible_binding_site_partners = cmd.select("sele_water_partner%s"%i, "sele_water_partner%s and (e. S or e. O or e. N)"%i)
 
-                print("Predicted %s possible_binding_site_partners for %s" % (possible_binding_site_partners, water_selection_name))
-
                 if possible_binding_site_partners:
                     # check if angles allow hbond
-                    possible_pairs = polarpairs("sele_water_partner%s"%i, "sele_water%s" % i, name="d_water_%s" % i, cutoff=options['binding_site_radius'])
+                    possible_pairs = polarpairs("sele_water_partner%s"%i, "sele_water%s" % i, name="d_water_%s" % i, cutoff=options['binding_site_radius'], context=context)
                     water_list.append("sele_water%s" % i)  # contains water molecule
                     water_distance_list.append("d_water_%s" % i)  # contains distance between water and binding site
 
                     # creates representation for residues interacting with water in binding site
                     water_polar_tuples_list.append(polartuples(possible_pairs, selection_name="h20_inter_%s"%i))
-                    print("water_polar_tuples_list", water_polar_tuples_list)
+                    water_pairs_list.append(possible_pairs)
                     cmd.delete("sele_water_partner%s"%i)
 
                 else:
@@ -416,6 +615,10 @@ def create_selections(options):
                     w_model = cmd.get_model("water_%s" % water_index)
                     for water_mol in w_model.atom:
                         water_to_output_list.append((water_mol.resi, water_mol.resn, water_mol.chain))
+                    analysis["water_bridges"].append({
+                        "water": [(water_mol.resi, water_mol.resn, water_mol.chain) for water_mol in w_model.atom],
+                        "pairs": water_pairs_list[water_index],
+                        "partner_residues": water_polar_tuples_list[water_index]})
                     water_to_enable_list.append("water_%s" % water_index)
                     water_to_enable_list.append(water_distance_name)
 
@@ -425,21 +628,22 @@ def create_selections(options):
             cmd.delete("sele_water_binding_site")
 
             #append water molecules to polar interactions file
-            with open("%s" % (POLAR_INTERACTIONS_FILENAME,), "a+") as f:
-                for tup in water_to_output_list:
-                    # f.write("RESI\tRESN\tCHAIN\n")
-                    f.write("%s\t%s\t%s\n" % tup)
+            for tup in water_to_output_list:
+                polar_interaction_lines.append("%s\t%s\t%s\n" % tup)
 
             # residues interacting with water and
             options["water_to_enable_list"] = water_to_enable_list
+            log_event("water_bridges", candidates=len(water_bridge_selection_names), waters=len(water_list),
+                      partner_residues=sum([len(tuples) for tuples in water_polar_tuples_list]))
 
     # Halogen Bond
     if options['check_halogen_interaction']:
         halogen_bond_selections = []
         halogen_interaction_partners = []
+        # number of halogen atoms and candidate partners per halogen, for the log
+        halogen_counts = {}
         for halogen in ["Cl", "Br", "I"]:
             number_of_halogen = cmd.select("sele_%s_interaction" % halogen, "ligand and e. %s" % halogen)
-            print("We have %s %s atoms in our ligand" % (number_of_halogen, halogen))
             if number_of_halogen:
 
                 cmd.select("sele_candidates",
@@ -448,15 +652,10 @@ def create_selections(options):
                            "sele_candidates and (e. O or e. S)")
                 number_of_candidates = cmd.select("sele_candidates",
                            "sele_candidates and binding_site and not ligand")
-
-                print("We have %s potential candidates for %s bonds" % (number_of_candidates, halogen))
+                halogen_counts[halogen] = (number_of_halogen, number_of_candidates)
                 if number_of_candidates:
                     # if angle ~160 and distance up to 4.5 A
                     # if angle 150-160 and distance up to 4.0 A
-                    candidate_model = cmd.get_model("sele_candidates")
-                    for atom in candidate_model.atom:
-                        print("Candidate from model = %s %s" % (atom.resn, atom.index))
-
                     cmd.select("sele_halo", "ligand and e. %s" % halogen)
                     model_br = cmd.get_model("sele_halo")
                     candidate_model = cmd.get_model("sele_candidates")
@@ -470,9 +669,7 @@ def create_selections(options):
                             cmd.select("ox_or_sulf_%s" %j, "id %s and binding_site" % oxygen_or_sulfur.id)
                             distance = cmd.distance("halogen_bond_%s_%s_%s" % (halogen, i, j), "sele_halo%s" % i, "ox_or_sulf_%s" % j)
                             angle = cmd.angle("halogen_bond_angle_%s_%s_%s" % (halogen, i, j), "sele_halo%s_c" % i , "sele_halo%s" % i, "ox_or_sulf_%s" % j)
-                            print("Distance = %s, angle = %s" % (distance, angle))
                             if (distance <= 4.5 and angle >= 160.0) or (distance <= 4.0 and angle >= 150.0):
-                                print("We have a halogen bond: halogen_bond_angle_%s_%s_%s" % (halogen, i, j))
                                 cmd.hide("label", "halogen_bond_%s_%s_%s" % (halogen, i, j))
                                 cmd.hide("label", "halogen_bond_angle_%s_%s_%s" % (halogen, i, j))
                                 cmd.color("cb_yellow", "halogen_bond_%s_%s_%s" % (halogen, i, j))
@@ -481,8 +678,12 @@ def create_selections(options):
                                 halogen_bond_selections.append("halogen_bond_angle_%s_%s_%s" % (halogen, i, j))
                                 cmd.create("halogen_interaction_partner%s"%i, "br. ox_or_sulf_%s" %j)
                                 halogen_interaction_partners.append("halogen_interaction_partner%s"%i)
+                                analysis["halogen_bonds"].append({
+                                    "halogen": (atom.resi, atom.resn, atom.chain, atom.name),
+                                    "partner": (oxygen_or_sulfur.resi, oxygen_or_sulfur.resn,
+                                                oxygen_or_sulfur.chain, oxygen_or_sulfur.name),
+                                    "distance": distance, "angle": angle})
                             else:
-                                print("No halogen bond, deleting selection!\n")
                                 cmd.delete("halogen_bond_angle_%s_%s_%s" % (halogen, i, j))
                             # always delete bond, angle is enough
                             cmd.delete("halogen_bond_%s_%s_%s" % (halogen, i, j))
@@ -501,135 +702,325 @@ def create_selections(options):
         if halogen_bond_selections:
             options['halogen_bond_selections'] = halogen_bond_selections
             options['halogen_interaction_partners'] = halogen_interaction_partners
-
-
-
-def main():
-    #check wheter environment variables for output are set:
-    if not MOVIE_MAKER_PATH:
-        raise argparse.ArgumentError("environment variable MOVIE_MAKER_PATH not set, got '%s' instead. Please set MOVIE_MAKER_PATH with directory of this script." % MOVIE_MAKER_PATH)
-    if not MOVIE_SCRIPT_FILENAME:
-        raise argparse.ArgumentError("environment variable MOVIE_SCRIPT_FILENAME not set, got '%s' instead." % MOVIE_SCRIPT_FILENAME)
-    if not POLAR_INTERACTIONS_FILENAME:
-        raise argparse.ArgumentError("environment variable POLAR_INTERACTIONS_FILENAME not set, got '%s' instead." % POLAR_INTERACTIONS_FILENAME)
-
-    # run all script components
-    commandline_options = parse_commandline_options()
+        log_event("halogen_bonds", halogens=dict((halogen, counts[0]) for halogen, counts in halogen_counts.items()),
+                  candidates=dict((halogen, counts[1]) for halogen, counts in halogen_counts.items()),
+                  bonds=len(halogen_bond_selections))
+
+
+
+def interaction_flag_keys(options):
+    '''
+    atoms per interaction flag of the coordinate buffer, identified by (resi, resn, chain, name)
+    '''
+    analysis = options['analysis']
+    water_pairs = [pair for water in analysis['water_bridges'] for pair in water['pairs']]
+    keys = atom_keys(set([atom for pair in analysis['polar_pairs'] + water_pairs for atom in pair]))
+    flag_keys = {
+        "polar": set([keys[atom][:4] for pair in analysis['polar_pairs'] for atom in pair]),
+        "water_bridge": set([keys[atom][:4] for pair in water_pairs for atom in pair]),
+        "halogen": set([tuple(bond[role]) for bond in analysis['halogen_bonds'] for role in ["halogen", "partner"]]),
+    }
+    for flag, selection in [("binding_site", "binding_site"), ("ligand", "ligand")]:
+        flag_keys[flag] = set()
+        cmd.iterate(selection, 'keys.add((resi, resn, chain, name))', space={'keys': flag_keys[flag]})
+    return flag_keys
+
+
+def run_job(commandline_options, writer, label_prefix="", interaction_context=None):
+    '''
+    complete pipeline for the loaded structure, outputs are handed to writer,
+    label_prefix distinguishes the outputs of batch elements in the manifest,
+    interaction_context replaces the default InteractionContext, e.g. by the reference engine of regression_suite
+    '''
     settings_dict = apply_settings(commandline_options)
-    create_selections(settings_dict)
-    create_views(settings_dict)
-    movie_script_file_path = "%smovie_maker_basic_script.pml" % MOVIE_MAKER_PATH
+    settings_dict['interaction_context'] = interaction_context or InteractionContext()
+    # objects of the loaded structure, replaced by the pocket in pocket-only mode
+    settings_dict['structure_objects'] = cmd.get_object_list("all")
+    with stage("ligand") as counts:
+        resolve_ligand(settings_dict)
+        counts["atoms"] = cmd.count_atoms("ligand")
+    if settings_dict['pocket_shell'] != "none":
+        with stage("pocket"):
+            extract_pocket(settings_dict)
+    with stage("plan"):
+        plan_resources(settings_dict)
+    writer.metrics[label_prefix + "execution_plan"] = settings_dict['execution_plan']
+    # quick preview first, so the choice of ligand and chain can be checked before the heavy part is done
+    if settings_dict['preview_image'] or settings_dict['preview_session']:
+        with stage("preview"):
+            create_preview(settings_dict, writer, label_prefix)
+    with stage("contacts") as counts:
+        compute_contacts(settings_dict)
+        counts["pairs"] = len(settings_dict['contact_table'].pairs)
+    if settings_dict['output_radius_table']:
+        # binding site and polar contacts of all radii from the same table
+        radius_table_text = "".join(settings_dict['contact_table'].radius_table_lines(
+            settings_dict['ligand_name'])).encode("utf-8")
+        writer.submit(label_prefix + "radius_table", settings_dict['output_radius_table'],
+                      lambda fh: fh.write(radius_table_text))
+    with stage("selections") as counts:
+        create_selections(settings_dict)
+        counts["binding_site_atoms"] = cmd.count_atoms("binding_site")
+        counts["output_lines"] = len(settings_dict["polar_interaction_lines"])
+    if settings_dict['export_coordinate_buffer']:
+        with stage("coordinate_buffer") as counts:
+            buffer_path = settings_dict['export_coordinate_buffer']
+            if not os.path.dirname(buffer_path):
+                buffer_path = default_buffer_path(buffer_path)
+            counts["atoms"] = export_coordinate_buffer(" or ".join(settings_dict['structure_objects']), buffer_path,
+                                                       interaction_flag_keys(settings_dict))
+        # outlives the job for the workers, the caller removes it, see coord_buffer
+        writer.register(label_prefix + "coordinate_buffer", buffer_path)
+    polar_interaction_text = "".join(settings_dict["polar_interaction_lines"]).encode("utf-8")
+    writer.submit(label_prefix + "polar_interactions", settings_dict['output_polar_interactions'],
+                  lambda fh: fh.write(polar_interaction_text))
+    with stage("views") as counts:
+        create_views(settings_dict)
+        counts["scenes"] = len(settings_dict["scene_plan"])
+    movie_script_file_path = settings_dict['output_movie_script']
 
     #create scenes and frames for movie
-    print("create scenes and frames for movie in %s:" % movie_script_file_path)
-    generate_movie_script(options=settings_dict, filepath=movie_script_file_path)
-    # execute a pymol script with @
-    cmd.do("@%s" % movie_script_file_path)
+    logger.info("create scenes and frames for movie in %s", movie_script_file_path)
+    with stage("movie"):
+        generate_movie_script(options=settings_dict, filepath=movie_script_file_path)
+        writer.register(label_prefix + "movie_script", movie_script_file_path)
+        # execute a pymol script with @
+        cmd.do("@%s" % movie_script_file_path)
     #Save session
-    cmd.save("basic_movie.pse")
-
-
-def create_views(options):
-
-    polar_interactions_defined = not options.has_key("no_polar_interactions_found")
-    water_in_binding_site = options["water_in_binding_site"] and options.has_key("water_to_enable_list")
-    halogen_bonds_defined = options['check_halogen_interaction'] and options.has_key('halogen_bond_selections')
-    # print ("polar_interactions_defined" , polar_interactions_defined)
-    # print ("halogen_bonds_defined" , halogen_bonds_defined)
-
-    cmd.disable("all")
-    cmd.orient("protein_surface")
-    cmd.zoom("protein_surface", 5)
-    cmd.enable("protein_surface")
-    cmd.set("transparency", 0.5)
-    cmd.enable("protein_cartoon")
-    cmd.view("1", action="store")
-    cmd.scene("F1", action="store")
+    writer.submit_session(settings_dict['output_session'], label=label_prefix + "session",
+                          compression=settings_dict['session_compression'])
+    return settings_dict
 
 
-    # 2 and F2 show ligand in pocket
-    cmd.disable("all")
-    cmd.enable("protein_surface")
-    cmd.set("transparency", 0.5)
-    cmd.enable("protein_cartoon")
-    cmd.enable("ligand")
-    cmd.view("2", action="store")
-    cmd.scene("F2", action="store")
+def read_batch_manifest(manifest_filename, ligand_table_filename=""):
+    '''
+    elements of a batch, one tab separated line per element: identifier, pdb file[, ligand name[, chain]]
+    ligand name and chain can also be given in a ligand table: identifier, ligand name[, chain]
+    without ligand name, --ligand_name is used or the ligand is detected automatically like in the super basic mode
+    '''
+    ligands = {}
+    if ligand_table_filename:
+        with open(ligand_table_filename) as fh:
+            for line in fh:
+                fields = line.rstrip("\n").split("\t")
+                if line.startswith("#") or not fields[0]:
+                    continue
+                ligands[fields[0]] = (fields + ["", ""])[1:3]
+
+    with open(manifest_filename) as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if line.startswith("#") or len(fields) < 2:
+                continue
+            identifier, pdb_filename = fields[:2]
+            ligand_name, chain_name = ligands.get(identifier, (fields + ["", ""])[2:4])
+            yield identifier, pdb_filename, ligand_name, chain_name
+
+
+def batch_element_options(commandline_options, identifier, pdb_filename, ligand_name, chain_name):
+    '''
+    options of a single batch element, outputs are named after its identifier
+    '''
+    options = commandline_options.copy()
+    options.pop("no_ligand_selected", None)
+    options['input'] = pdb_filename
+    # ligand name and chain of the commandline are the default for elements without their own
+    ligand_name = ligand_name or commandline_options['ligand_name']
+    options['ligand_name'] = ligand_name
+    options['chain_name'] = chain_name or commandline_options['chain_name'] or "A"
+    # option for super basic mode
+    if not ligand_name:
+        options["no_ligand_selected"] = True
 
+    filename = re.sub(r"[^A-Za-z0-9_.-]", "_", identifier)
+    output_dir = commandline_options['batch_output_dir']
+    session_extension = {"none": "pse", "gzip": "pse.gz", "zstd": "pse.zst"}[options['session_compression']]
+    options['output_session'] = os.path.join(output_dir, "sessions", "%s.%s" % (filename, session_extension))
+    options['output_polar_interactions'] = os.path.join(output_dir, "polar_interactions", "%s.txt" % filename)
+    options['output_movie_script'] = os.path.join(output_dir, "movie_scripts", "%s.pml" % filename)
+    options['preview_image'] = os.path.join(output_dir, "previews", "%s.png" % filename)
+    options['preview_session'] = ""
+    options['output_radius_table'] = ""
+    options['export_coordinate_buffer'] = ""
+    return options
 
-    # 3 and F3
-    cmd.disable("all")
-    cmd.enable("protein_cartoon")
-    cmd.enable("ligand")
-    cmd.view("3", action="store")
-    cmd.scene("F3", action="store")
 
+def create_batch_directories(output_dir):
+    '''
+    subdirectories of the batch outputs, see batch_element_options
+    '''
+    for subdirectory in ["sessions", "polar_interactions", "movie_scripts", "previews"]:
+        directory = os.path.join(output_dir, subdirectory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+
+def run_batch(commandline_options):
+    '''
+    process the elements of a batch manifest one after the other in this pymol process,
+    the outputs of an element are written before the next one starts, a failed write fails its element
+    '''
+    # bounded, at most batch_pending_writes outputs wait in memory to be written
+    writer = OutputWriter(max_pending=max(1, commandline_options['batch_pending_writes']))
+    create_batch_directories(commandline_options['batch_output_dir'])
+
+    processed, failed = [], []
+    for identifier, pdb_filename, ligand_name, chain_name in read_batch_manifest(
+            commandline_options['batch_manifest'], commandline_options['batch_ligand_table']):
+        element_options = batch_element_options(commandline_options, identifier, pdb_filename, ligand_name, chain_name)
+        reset_session()
+        try:
+            with stage("element %s" % identifier):
+                load_structure(pdb_filename)
+                run_job(element_options, writer, label_prefix="%s/" % identifier)
+                errors = writer.flush()
+            if errors:
+                raise IOError("Could not write %s output to '%s': %s" % errors[0])
+            processed.append(identifier)
+        except Exception:
+            # a broken element does not stop the remaining ones
+            logger.exception("Batch element %s failed", identifier)
+            failed.append(identifier)
+            # remove partial outputs, e.g. a preview without session, so the output collections line up
+            writer.flush()
+            writer.discard([element_options[output] for output in
+                            ["output_session", "output_polar_interactions", "output_movie_script", "preview_image"]] +
+                           ["%s.png" % element_options['preview_image']])
+
+    writer.metrics["batch"] = {"processed": processed, "failed": failed}
+    with stage("session"):
+        writer.close()
+    if commandline_options['output_manifest']:
+        writer.write_manifest(commandline_options['output_manifest'])
+    if failed and not processed:
+        raise RuntimeError("all %s batch elements failed, see log for details" % len(failed))
 
-    # 4 and F4
-    cmd.disable("all")
-    cmd.enable("ligand")
-    cmd.view("4", action="store")
-    cmd.scene("F4", action="store")
 
-    # 5 and F5
-    cmd.disable("all")
-    cmd.enable("ligand")
-    cmd.enable("protein_cartoon")
-    if options["cofactor_in_binding_site"]:
-        cmd.enable("cofactor")
-    cmd.orient("ligand")
-    cmd.zoom("binding_site", 5)
-    cmd.view("5", action="store")
-    cmd.scene("F5", action="store")
+def main():
+    #check wheter environment variables for output are set:
+    if not MOVIE_MAKER_PATH:
+        raise argparse.ArgumentError("environment variable MOVIE_MAKER_PATH not set, got '%s' instead. Please set MOVIE_MAKER_PATH with directory of this script." % MOVIE_MAKER_PATH)
 
-    # 6 and F6
-    cmd.disable("all")
-    cmd.enable("ligand")
-    cmd.enable("binding_site")
+    # run all script components
+    commandline_options = parse_commandline_options()
+    if commandline_options['batch_manifest']:
+        run_batch(commandline_options)
+        return
+
+    # the preview session is pickled and written in the background during the full run,
+    # the final session is submitted last, close waits for it
+    writer = OutputWriter()
+    load_structure(commandline_options['input'])
+    settings_dict = run_job(commandline_options, writer)
+    with stage("session"):
+        writer.close()
+    if settings_dict['output_manifest']:
+        writer.write_manifest(settings_dict['output_manifest'])
+
+
+def scene_plan(options):
+    '''
+    declarative description of the scenes F1 to F8, derived from the analysis results
+    each entry holds the names visible in the scene and where to orient and zoom,
+    names of groups created in group_scene_objects are used instead of their members
+    '''
+    polar_interactions_defined = "no_polar_interactions_found" not in options
+    water_in_binding_site = options["water_in_binding_site"] and options.get("water_to_enable_list")
+    halogen_bonds_defined = options['check_halogen_interaction'] and 'halogen_bond_selections' in options
+
+    pocket = ["ligand"]
     if options["cofactor_in_binding_site"]:
-        cmd.enable("cofactor")
-    if polar_interactions_defined:
-        cmd.enable("polar_interacting_residues")
-        cmd.enable("polar_int_d")
-        cmd.zoom("polar_interacting_residues", 5)
-        if water_in_binding_site:
-            for sel in options["water_to_enable_list"]:
-                cmd.enable(sel)
-    else:
-        cmd.zoom("binding_site", 5)
-    cmd.view("6", action="store")
-    cmd.scene("F6", action="store")
+        pocket.append("cofactor")
 
-    # 7 and F7
-    cmd.disable("all")
-    cmd.enable("ligand")
-    if options["cofactor_in_binding_site"]:
-        cmd.enable("cofactor")
-    # cmd.enable("binding_site")
+    interactions = []
     if polar_interactions_defined:
-        cmd.enable("polar_interacting_residues")
-        cmd.enable("polar_int_d")
-        cmd.enable("interaction_polar")
-        cmd.zoom("polar_int_d", 5)
+        interactions.append("polar_contacts")
         if water_in_binding_site:
-            for sel in options["water_to_enable_list"]:
-                cmd.enable(sel)
-    else:
-        cmd.zoom("ligand", 5)
-    cmd.view("7", action="store")
-    cmd.scene("F7", action="store")
+            interactions.append("water_bridges")
+
+    plan = [
+        # 1 and F1 surface for general inspection of the protein
+        {"scene": "F1", "view": "1", "visible": ["protein_surface", "protein_cartoon"],
+         "orient": "protein_surface", "zoom": ("protein_surface", 5)},
+        # 2 and F2 show ligand in pocket
+        {"scene": "F2", "view": "2", "visible": ["protein_surface", "protein_cartoon", "ligand"]},
+        # 3 and F3
+        {"scene": "F3", "view": "3", "visible": ["protein_cartoon", "ligand"]},
+        # 4 and F4
+        {"scene": "F4", "view": "4", "visible": ["ligand"]},
+        # 5 and F5
+        {"scene": "F5", "view": "5", "visible": pocket + ["protein_cartoon"],
+         "orient": "ligand", "zoom": ("binding_site", 5)},
+        # 6 and F6
+        {"scene": "F6", "view": "6", "visible": pocket + ["binding_site"] + interactions,
+         "zoom": ("polar_interacting_residues" if polar_interactions_defined else "binding_site", 5)},
+        # 7 and F7
+        {"scene": "F7", "view": "7", "visible": pocket + interactions,
+         "zoom": ("polar_int_d" if polar_interactions_defined else "ligand", 5)},
+    ]
 
     # 8 and F8
     if halogen_bonds_defined:
-        cmd.disable("all")
-        cmd.enable("ligand")
-        for selection in options['halogen_bond_selections']:
-            cmd.enable(selection)
-        for selection2 in options['halogen_interaction_partners']:
-            cmd.enable(selection2)
-        cmd.zoom(options['halogen_bond_selections'][0], 5)
-        cmd.view("8", action="store")
-        cmd.scene("F8", action="store")
+        plan.append({"scene": "F8", "view": "8", "visible": ["ligand", "halogen_bonds"],
+                     "zoom": (options['halogen_bond_selections'][0], 5)})
+    return plan
+
+
+def group_scene_objects(options):
+    '''
+    collect polar contacts, per water and per halogen bond objects in groups,
+    so scenes toggle a few names instead of all of them, returns the members per group
+    '''
+    groups = {}
+    if "no_polar_interactions_found" not in options:
+        groups["polar_contacts"] = ["polar_interacting_residues", "polar_int_d"]
+    if options.get("water_to_enable_list"):
+        groups["water_bridges"] = options["water_to_enable_list"]
+    if 'halogen_bond_selections' in options:
+        groups["halogen_bonds"] = options['halogen_bond_selections'] + sorted(set(options['halogen_interaction_partners']))
+    for group, members in groups.items():
+        cmd.group(group, " ".join(members))
+    return groups
+
+
+def create_views(options):
+
+    plan = scene_plan(options)
+    groups = group_scene_objects(options)
+    cmd.set("transparency", 0.5)
+
+    # disable everything once, afterwards only toggle the names that differ between consecutive scenes
+    cmd.disable("all")
+    # disable all also disabled the group members, enabling a group does not enable them again,
+    # so they stay enabled and only the group is toggled
+    for members in groups.values():
+        for member in members:
+            cmd.enable(member)
+    # scenes of an earlier batch element which are not part of this plan, e.g. F8, show nothing
+    for scene in cmd.get_scene_list():
+        if scene not in [entry["scene"] for entry in plan]:
+            cmd.scene(scene, action="store", color=0, rep=0)
+    visible = []
+    for entry in plan:
+        for name in visible:
+            if name not in entry["visible"]:
+                cmd.disable(name)
+        for name in entry["visible"]:
+            if name not in visible:
+                cmd.enable(name)
+        visible = entry["visible"]
+
+        if "orient" in entry:
+            cmd.orient(entry["orient"])
+        if "zoom" in entry:
+            cmd.zoom(*entry["zoom"])
+        cmd.view(entry["view"], action="store")
+        # representations and colors are identical in all scenes, only store view and visibility
+        cmd.scene(entry["scene"], action="store", color=0, rep=0)
+    # the draft F5 and F6 of the preview were stored first
+    cmd.scene_order(" ".join([entry["scene"] for entry in plan]), location="top")
+
+    options["scene_plan"] = plan
 
     # 9 and F9
     # zoom between polar interactions?
@@ -652,97 +1043,106 @@ def create_views(options):
 
 # generate movie script
 def generate_movie_script(options, filepath):
-    with open(filepath, "w+") as fh:
+    # the resource guard may shorten the movie, all segments are scaled alike
+    scale = options.get('movie_frame_scale', 1.0)
+
+    def frame(number):
+        return int(round(number * scale))
+
+    # the script is written in one go and only appears at filepath when complete
+    with atomic_open(filepath) as fh:
+        if options.get('execution_plan', {}).get('degradations'):
+            fh.write("# degraded to fit resource limits: %s\n" % ", ".join(options['execution_plan']['degradations']))
         # fh.write("viewport 2000, 2000\n")
         fh.write("viewport 500, 500\n")
 
-    # Basic movie:
-    # 900 frames for general inspection of protein with ligand
-    # 100 frames zooming in on binding pocket + fadeout surface of protein -> F5
-    # 200 frames inspection of ligand in binding pocket with cartoon display
-    # 50 frames transition zoom to binding site -> F6
-    # 200 frames turn 50 y and -100 y to inspect ligand interaction
+        # Basic movie:
+        # 900 frames for general inspection of protein with ligand
+        # 100 frames zooming in on binding pocket + fadeout surface of protein -> F5
+        # 200 frames inspection of ligand in binding pocket with cartoon display
+        # 50 frames transition zoom to binding site -> F6
+        # 200 frames turn 50 y and -100 y to inspect ligand interaction
 
-    number_of_frames = 1450
+        number_of_frames = 1450
 
-    polar_interactions_defined = not options.has_key("no_polar_interactions_found")
-    halogen_bonds_defined = options['check_halogen_interaction'] and options.has_key('halogen_bond_selections')
+        polar_interactions_defined = "no_polar_interactions_found" not in options
+        halogen_bonds_defined = options['check_halogen_interaction'] and 'halogen_bond_selections' in options
 
-    if polar_interactions_defined:
-        number_of_frames += 400
+        if polar_interactions_defined:
+            number_of_frames += 400
 
-    if halogen_bonds_defined:
-        number_of_frames += 250
+        if halogen_bonds_defined:
+            number_of_frames += 250
 
-    with open(filepath, "a+") as fh:
-        fh.write("mset 1x%s\n" % number_of_frames)
+        fh.write("mset 1x%s\n" % frame(number_of_frames))
         fh.write(
             """mview store, 1, scene=F1
-movie_fade cartoon_transparency, 301, 1.0, 302, 0.0
+movie_fade cartoon_transparency, %s, 1.0, %s, 0.0
 turn y, 120
-mview store, 100, power = 1.0
+mview store, %s, power = 1.0
 turn y, 120
-mview store, 200, power = 1.0
-mview store, 300, scene=F1
-mview store, 301, scene=F2
+mview store, %s, power = 1.0
+mview store, %s, scene=F1
+mview store, %s, scene=F2
 turn x, 120
-mview store, 400, power = 1.0
+mview store, %s, power = 1.0
 turn x, 120
-mview store, 500, power = 1.0
-mview store, 600, scene=F2
-mview store, 601, scene=F3
+mview store, %s, power = 1.0
+mview store, %s, scene=F2
+mview store, %s, scene=F3
 turn y, 120
-mview store, 700, power = 1.0
+mview store, %s, power = 1.0
 turn y, 120
-mview store, 800, power = 1.0
-mview store, 900, scene=F3
-movie_fade cartoon_transparency, 901, 0.0, 990, 1.0
-mview store, 1000, scene=F5
+mview store, %s, power = 1.0
+mview store, %s, scene=F3
+movie_fade cartoon_transparency, %s, 0.0, %s, 1.0
+mview store, %s, scene=F5
 turn x, 50
-mview store, 1100, power = 1.0
+mview store, %s, power = 1.0
 turn x, 50
-mview store, 1150, scene=F5
-mview store, 1200, scene=F6
+mview store, %s, scene=F5
+mview store, %s, scene=F6
 turn y, 50
-mview store, 1300, power = 1.0
+mview store, %s, power = 1.0
 turn y, -100
-mview store, 1450, power = 1.0
-"""
+mview store, %s, power = 1.0
+""" % (frame(300) + 1, frame(300) + 2, frame(100), frame(200), frame(300), frame(300) + 1,
+       frame(400), frame(500), frame(600), frame(600) + 1, frame(700), frame(800), frame(900),
+       frame(900) + 1, frame(990), frame(1000), frame(1100), frame(1150), frame(1200), frame(1300), frame(1450))
         )
 
-    current_frame_number = 1450
+        current_frame_number = 1450
 
-    #only if polar interactions defined
-    # 50 frames transition zoom to binding site with polar interactions -> F7
-    # 300 frames turn 60 y and -120 y to inspect polar interactions
-    if polar_interactions_defined:
-        with open(filepath, "a+") as fh:
+        #only if polar interactions defined
+        # 50 frames transition zoom to binding site with polar interactions -> F7
+        # 300 frames turn 60 y and -120 y to inspect polar interactions
+        if polar_interactions_defined:
             fh.write(
-            """mview store, 1500, scene=F7
+            """mview store, %s, scene=F7
 turn y, 60
-mview store, 1600, power = 1.0
+mview store, %s, power = 1.0
 turn y, -120
-mview store, 1800, power = 1.0
-mview store, 1850, scene=F7
-"""
+mview store, %s, power = 1.0
+mview store, %s, scene=F7
+""" % (frame(1500), frame(1600), frame(1800), frame(1850))
             )
-        current_frame_number += 400
+            current_frame_number += 400
 
-    #only if halogen interactions desired
-    # 50 frames transition zoom to halogen interactions -> F8
-    # 200 frames turn y 60, -120 y to inspect halogen interactions
-    if halogen_bonds_defined:
-        with open(filepath, "a+") as fh:
-            fh.write("mview store, %s, scene=F8\n" % (current_frame_number +50))
+        #only if halogen interactions desired
+        # 50 frames transition zoom to halogen interactions -> F8
+        # 200 frames turn y 60, -120 y to inspect halogen interactions
+        if halogen_bonds_defined:
+            fh.write("mview store, %s, scene=F8\n" % frame(current_frame_number +50))
             fh.write("turn y, 60\n")
-            fh.write("mview store, %s, power = 1.0\n" % (current_frame_number+150))
+            fh.write("mview store, %s, power = 1.0\n" % frame(current_frame_number+150))
             fh.write("turn y, -120\n")
-            fh.write("mview store, %s, scene=F8\n" % (current_frame_number+250))
-        current_frame_number += 250
+            fh.write("mview store, %s, scene=F8\n" % frame(current_frame_number+250))
+            current_frame_number += 250
 
-    with open(filepath, "a+") as fh:
         fh.write("mview reinterpolate\n")
 
 
-main()
+# run as pymol script, regression_suite imports the pipeline without running it
+if __name__ != "movie_maker":
+    main()
 
@@ -7,14 +7,21 @@
 #echo $5  # path pse file
 #echo $6  # path to polar interaction .txt file
 #echo $7  # path pymol-script .pml file
-#echo $8  # binding_site_radius
-#echo $9  # check_halogen_interaction
-#echo $10  # water_in_binding_site
-#echo $11 # color_carbon
-#echo $12 # session_export_version
-#echo $13 # color of polar-interactions
-#echo $14 # cofactor name
-#echo $15 # color of carbon in cofactor
+#echo $8  # path preview .png thumbnail
+#echo $9  # path preview draft .pse file
+#echo $10  # path manifest .json file
+#echo $11  # binding_site_radius
+#echo $12  # check_halogen_interaction
+#echo $13  # water_in_binding_site
+#echo $14 # color_carbon
+#echo $15 # session_export_version
+#echo $16 # color of polar-interactions
+#echo $17 # session compression: none, gzip or zstd
+#echo $18 # pocket-only extraction: none, residues or chains
+#echo $19 # radius of the extracted pocket
+#echo $20 # path radius table .txt file, empty if not requested
+#echo $21 # cofactor name
+#echo $22 # color of carbon in cofactor
 
 #used in our pymolscript as prefix for our script files, $galaxy is set in the startup script of the galaxy server
 export MOVIEMAKERPATH="$galaxy""tools/customTools/movie_maker/"
@@ -22,26 +29,15 @@ export MOVIEMAKERPATH="$galaxy""tools/customTools/movie_maker/"
 #include library path to pymol in pythonpath, so python knows about the pymol 1.8.4 module
 #include current directory in pythonpath, so scripts are available to import
 export PYTHONPATH="/home/webservices/philipp/special_pymol/modules:${MOVIEMAKERPATH}:${PYTHONPATH}"
-#used in pymolscript to save a seccond output
-export POLAR_INTERACTION_FILENAME="polar_interaction_partners.txt"
-export MOVIE_SCRIPT_FILENAME="${MOVIEMAKERPATH}""movie_maker_basic_script.pml"
 
+#logs are written to the working directory of the job, so concurrent jobs do not share a log file
 #echo "working on $MOVIEMAKERPATH"
 #echo "executing $MOVIEMAKERPATH""movie_maker_basic.py"
-#echo "got "$#" arguments" > /home/webservices/philipp/movie_maker.log
-#check number of passed arguments, if we have 13, we have no cofactor, if 15 cofactor and color_carbon_cofactor
-if [[ $# -eq 13 ]]
+#echo "got "$#" arguments"
+#check number of passed arguments, if we have 20, we have no cofactor, if 22 cofactor and color_carbon_cofactor
+if [[ $# -eq 20 ]]
     then
-        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --input "$1" --ligand_name $2 --chain_name $3 --color_blind_friendly $4 --binding_site_radius $8 --check_halogen_interaction $9 --water_in_binding_site "${10}" --color_carbon "${11}" --session_export_version ${12} --color_polar_interactions ${13} > /home/webservices/philipp/movie_maker.log
+        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --input "$1" --ligand_name $2 --chain_name $3 --color_blind_friendly $4 --preview_image "$8" --preview_session "$9" --output_session "$5" --output_polar_interactions "$6" --output_movie_script "$7" --output_manifest "${10}" --binding_site_radius ${11} --check_halogen_interaction ${12} --water_in_binding_site "${13}" --color_carbon "${14}" --session_export_version ${15} --color_polar_interactions ${16} --session_compression "${17}" --pocket_shell "${18}" --pocket_radius "${19}" --output_radius_table "${20}" --log_file movie_maker.log > pymol.log
     else
-        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --input "$1" --ligand_name "$2" --chain_name "$3" --color_blind_friendly "$4" --binding_site_radius "$8" --check_halogen_interaction $9 --water_in_binding_site "${10}" --color_carbon "${11}" --session_export_version ${12} --color_polar_interactions ${13} --cofactor_name ${14} --color_carbon_cofactor ${15} > /home/webservices/philipp/movie_maker.log
+        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --input "$1" --ligand_name "$2" --chain_name "$3" --color_blind_friendly "$4" --preview_image "$8" --preview_session "$9" --output_session "$5" --output_polar_interactions "$6" --output_movie_script "$7" --output_manifest "${10}" --binding_site_radius "${11}" --check_halogen_interaction ${12} --water_in_binding_site "${13}" --color_carbon "${14}" --session_export_version ${15} --color_polar_interactions ${16} --session_compression "${17}" --pocket_shell "${18}" --pocket_radius "${19}" --output_radius_table "${20}" --cofactor_name ${21} --color_carbon_cofactor ${22} --log_file movie_maker.log > pymol.log
 fi
-
-# move created pymol session from current directory to output directory
-mv basic_movie.pse "$5"
-
-# move textfile from pymol-script to destination directory
-mv $POLAR_INTERACTION_FILENAME "$6"
-
-# move pml script to destination directory, in combination with session allows easy modification of the movie
-mv $MOVIE_SCRIPT_FILENAME "$7"
\ No newline at end of file
@@ -7,6 +7,9 @@
 #echo $5 # path pse file
 #echo $6 # path pymol-script file
 #echo $7 # path for pml script file
+#echo $8 # path preview .png thumbnail
+#echo $9 # path preview draft .pse file
+#echo $10 # path manifest .json file
 
 #used in our pymolscript as prefix for our script files, $galaxy is set in the startup script of the galaxy server
 export MOVIEMAKERPATH="$galaxy""tools/customTools/movie_maker/"
@@ -14,21 +17,10 @@ export MOVIEMAKERPATH="$galaxy""tools/customTools/movie_maker/"
 #include library path to pymol in pythonpath, so python knows about the pymol 1.8.4 module
 #include current directory in pythonpath, so scripts are available to import
 export PYTHONPATH="/home/webservices/philipp/special_pymol/modules:${MOVIEMAKERPATH}:${PYTHONPATH}"
-#used in pymolscript to save a seccond output
-export POLAR_INTERACTION_FILENAME="polar_interaction_partners.txt"
-export MOVIE_SCRIPT_FILENAME="${MOVIEMAKERPATH}""movie_maker_basic_script.pml"
 
 
 
+#logs are written to the working directory of the job, so concurrent jobs do not share a log file
 #echo "working on $MOVIEMAKERPATH"
 #echo "executing $MOVIEMAKERPATH""movie_maker_basic.py"
-/home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --input "$1" --ligand_name $2 --chain_name $3 --color_blind_friendly $4 > /home/webservices/philipp/movie_maker.log
-
-# move created pymol session from current directory to output directory
-mv basic_movie.pse "$5"
-
-# move textfile from pymol-script to destination directory
-mv $POLAR_INTERACTION_FILENAME "$6"
-
-# move pml script to destination directory, in combination with session allows easy modification of the movie
-mv $MOVIE_SCRIPT_FILENAME "$7"
\ No newline at end of file
+/home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --input "$1" --ligand_name $2 --chain_name $3 --color_blind_friendly $4 --preview_image "$8" --preview_session "$9" --output_session "$5" --output_polar_interactions "$6" --output_movie_script "$7" --output_manifest "${10}" --log_file movie_maker.log > pymol.log
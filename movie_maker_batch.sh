@@ -0,0 +1,46 @@
+#!/bin/bash
+#execute our lovely script with the correct pymol, python library support and passed commandline parameters
+#process all pdb files of a galaxy dataset collection in a single pymol process
+#echo $1 # path to batch manifest, tab separated: element identifier, path to pdb file
+#echo $2 # path to ligand table, tab separated: element identifier, ligand name, chain (may be empty)
+#echo $3 # path manifest .json file
+#echo $4 # use colorblind friendly coloring?
+#echo $5 # ligand name for elements without an entry in the ligand table, empty for automatic detection
+#echo $6 # chain for elements without an entry in the ligand table
+#echo $7 # session_export_version
+#echo $8 # color_carbon
+#only in advanced mode:
+#echo $9 # binding_site_radius
+#echo $10 # check_halogen_interaction
+#echo $11 # water_in_binding_site
+#echo $12 # color of polar-interactions
+#echo $13 # session compression: none, gzip or zstd
+#echo $14 # pocket-only extraction: none, residues or chains
+#echo $15 # radius of the extracted pocket
+#echo $16 # cofactor name
+#echo $17 # color of carbon in cofactor
+
+#used in our pymolscript as prefix for our script files, $galaxy is set in the startup script of the galaxy server
+export MOVIEMAKERPATH="$galaxy""tools/customTools/movie_maker/"
+
+#include library path to pymol in pythonpath, so python knows about the pymol 1.8.4 module
+#include current directory in pythonpath, so scripts are available to import
+export PYTHONPATH="/home/webservices/philipp/special_pymol/modules:${MOVIEMAKERPATH}:${PYTHONPATH}"
+
+
+#logs are written to the working directory of the job, so concurrent jobs do not share a log file
+#outputs are written to sessions/, polar_interactions/, movie_scripts/ and previews/ in the working directory
+#and discovered by galaxy as output collections
+#check number of passed arguments, 8 in basic mode, 15 in advanced mode, 17 in advanced mode with cofactor
+if [[ $# -eq 8 ]]
+    then
+        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --batch_manifest "$1" --batch_ligand_table "$2" --output_manifest "$3" --color_blind_friendly "$4" --ligand_name "$5" --chain_name "$6" --session_export_version "$7" --color_carbon "$8" --batch_output_dir "." --log_file movie_maker.log > pymol.log
+elif [[ $# -eq 15 ]]
+    then
+        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --batch_manifest "$1" --batch_ligand_table "$2" --output_manifest "$3" --color_blind_friendly "$4" --ligand_name "$5" --chain_name "$6" --session_export_version "$7" --color_carbon "$8" --batch_output_dir "." --binding_site_radius "$9" --check_halogen_interaction "${10}" --water_in_binding_site "${11}" --color_polar_interactions "${12}" --session_compression "${13}" --pocket_shell "${14}" --pocket_radius "${15}" --log_file movie_maker.log > pymol.log
+elif [[ $# -eq 17 ]]
+    then
+        /home/webservices/philipp/special_pymol/pymol -c -u $MOVIEMAKERPATH"movie_maker.py" --batch_manifest "$1" --batch_ligand_table "$2" --output_manifest "$3" --color_blind_friendly "$4" --ligand_name "$5" --chain_name "$6" --session_export_version "$7" --color_carbon "$8" --batch_output_dir "." --binding_site_radius "$9" --check_halogen_interaction "${10}" --water_in_binding_site "${11}" --color_polar_interactions "${12}" --session_compression "${13}" --pocket_shell "${14}" --pocket_radius "${15}" --cofactor_name "${16}" --color_carbon_cofactor "${17}" --log_file movie_maker.log > pymol.log
+    else
+        (>&2 echo "'Batch mode' failed, wrong number of parameters, got "$#" expected 8, 15 or 17")
+fi
@@ -0,0 +1,230 @@
+'''
+Timeline of a movie script written by generate_movie_script, without pymol.
+
+The pymol script is parsed line by line (viewport, mset, mview store, turn,
+movie_fade and mview reinterpolate) into keyframes and fades. From these every
+frame gets its scene, the interpolation segment between two keyframes it
+belongs to, whether the camera holds or moves and which settings change. A
+frame of a hold without changing settings looks like its predecessor and does
+not have to be rendered again, which gives the render cost estimate and
+contiguous shards of similar cost for a render farm.
+
+Problems like keyframes outside of the movie, fades outside of the movie or a
+missing mset are reported instead of raising, so a broken script can still be
+inspected.
+
+Example usage:
+
+python movie_timeline.py movie_script.pml --shards 4 --frame_table frames.tsv
+python movie_timeline.py movie_script.pml --json
+
+'''
+from __future__ import print_function
+import argparse
+import json
+import re
+
+# ray traced seconds per megapixel of a frame, rough value for pymol 1.8.4 on the galaxy server
+SECONDS_PER_MEGAPIXEL = 4.0
+# pymol defaults if the script does not set them
+DEFAULT_VIEWPORT = (640, 480)
+MOVIE_FPS = 30.0
+
+VIEWPORT = re.compile(r"viewport\s+(\d+)\s*,\s*(\d+)$")
+MSET = re.compile(r"mset\s+1\s*x\s*(\d+)$")
+MVIEW_STORE = re.compile(r"mview\s+store\s*,\s*(\d+)\s*(?:,(.*))?$")
+MVIEW_REINTERPOLATE = re.compile(r"mview\s+reinterpolate$")
+TURN = re.compile(r"turn\s+([xyz])\s*,\s*(-?[\d.]+)$")
+MOVIE_FADE = re.compile(r"movie_fade\s+(\w+)\s*,\s*(\d+)\s*,\s*(-?[\d.]+)\s*,\s*(\d+)\s*,\s*(-?[\d.]+)$")
+
+
+def parse_movie_script(lines):
+    '''
+    keyframes, fades, number of frames and viewport of a movie script
+    the view of a keyframe is its scene and the turns applied since the scene was stored
+    '''
+    timeline = {"viewport": DEFAULT_VIEWPORT, "frames": 0, "keyframes": {}, "fades": [],
+                "reinterpolate": False, "problems": []}
+    scene, turns = None, ()
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = VIEWPORT.match(line)
+        if match:
+            timeline["viewport"] = (int(match.group(1)), int(match.group(2)))
+            continue
+        match = MSET.match(line)
+        if match:
+            timeline["frames"] = int(match.group(1))
+            continue
+        match = MVIEW_STORE.match(line)
+        if match:
+            frame = int(match.group(1))
+            arguments = dict([[part.strip() for part in argument.split("=", 1)]
+                              for argument in (match.group(2) or "").split(",") if "=" in argument])
+            if "scene" in arguments:
+                # storing a scene recalls it, later turns start from its view
+                scene, turns = arguments["scene"], ()
+            if frame in timeline["keyframes"]:
+                timeline["problems"].append("line %s: keyframe %s stored again" % (line_number, frame))
+            timeline["keyframes"][frame] = {"frame": frame, "scene": arguments.get("scene"),
+                                            "view": (scene, turns), "line": line_number}
+            continue
+        match = TURN.match(line)
+        if match:
+            turns = turns + ((match.group(1), float(match.group(2))),)
+            continue
+        match = MOVIE_FADE.match(line)
+        if match:
+            timeline["fades"].append({"setting": match.group(1),
+                                      "start_frame": int(match.group(2)), "start_value": float(match.group(3)),
+                                      "end_frame": int(match.group(4)), "end_value": float(match.group(5))})
+            continue
+        if MVIEW_REINTERPOLATE.match(line):
+            timeline["reinterpolate"] = True
+            continue
+        timeline["problems"].append("line %s: not part of the timeline: %s" % (line_number, line))
+
+    timeline["keyframes"] = [timeline["keyframes"][frame] for frame in sorted(timeline["keyframes"])]
+    validate(timeline)
+    return timeline
+
+
+def validate(timeline):
+    problems = timeline["problems"]
+    frames = timeline["frames"]
+    if not frames:
+        problems.append("no mset, the movie has no frames")
+    if not timeline["keyframes"]:
+        problems.append("no keyframes stored")
+    elif timeline["keyframes"][0]["scene"] is None:
+        problems.append("first keyframe %s does not store a scene" % timeline["keyframes"][0]["frame"])
+    for keyframe in timeline["keyframes"]:
+        if not 1 <= keyframe["frame"] <= frames:
+            problems.append("line %s: keyframe %s outside of frames 1 to %s" % (keyframe["line"], keyframe["frame"], frames))
+    for fade in timeline["fades"]:
+        if fade["start_frame"] > fade["end_frame"]:
+            problems.append("fade of %s ends before it starts" % fade["setting"])
+        if not (1 <= fade["start_frame"] and fade["end_frame"] <= frames):
+            problems.append("fade of %s outside of frames 1 to %s" % (fade["setting"], frames))
+    if timeline["keyframes"] and not timeline["reinterpolate"]:
+        problems.append("no mview reinterpolate after the keyframes")
+
+
+def frame_table(timeline):
+    '''
+    one row per frame: scene shown, segment (index of the keyframe it starts at, -1 before the first),
+    hold or transition, changed settings and whether the frame has to be rendered
+    '''
+    keyframes = timeline["keyframes"]
+    rows = []
+    segment, scene = -1, None
+    for frame in range(1, timeline["frames"] + 1):
+        while segment + 1 < len(keyframes) and keyframes[segment + 1]["frame"] <= frame:
+            segment += 1
+            if keyframes[segment]["scene"] is not None:
+                scene = keyframes[segment]["scene"]
+        if 0 <= segment < len(keyframes) - 1 and keyframes[segment]["view"] != keyframes[segment + 1]["view"]:
+            motion = "transition"
+        else:
+            motion = "hold"
+        # a fade changes its setting in every frame after its start frame
+        changed_settings = sorted(set([fade["setting"] for fade in timeline["fades"]
+                                       if fade["start_frame"] < frame <= fade["end_frame"]
+                                       and fade["start_value"] != fade["end_value"]]))
+        segment_start = keyframes[segment]["frame"] if segment >= 0 else 1
+        render = motion == "transition" or bool(changed_settings) or frame == segment_start
+        rows.append({"frame": frame, "scene": scene, "segment": segment, "motion": motion,
+                     "changed_settings": changed_settings, "render": render})
+    return rows
+
+
+def render_cost(rows, viewport, seconds_per_megapixel=SECONDS_PER_MEGAPIXEL):
+    '''
+    estimated seconds to render every frame of rows, frames which repeat their predecessor cost nothing
+    '''
+    megapixels = viewport[0] * viewport[1] / 1e6
+    return [megapixels * seconds_per_megapixel if row["render"] else 0.0 for row in rows]
+
+
+def shards(rows, costs, number_of_shards):
+    '''
+    contiguous frame ranges of about the same render cost
+    '''
+    total = sum(costs)
+    result = []
+    start, cost = 1, 0.0
+    for row, frame_cost in zip(rows, costs):
+        cost += frame_cost
+        remaining_shards = number_of_shards - len(result)
+        if remaining_shards > 1 and cost >= total / number_of_shards:
+            result.append({"start": start, "end": row["frame"], "seconds": round(cost, 1)})
+            start, cost = row["frame"] + 1, 0.0
+    if rows and start <= rows[-1]["frame"]:
+        result.append({"start": start, "end": rows[-1]["frame"], "seconds": round(cost, 1)})
+    return result
+
+
+def summary(timeline, rows, costs, number_of_shards=1):
+    scene_frames = {}
+    for row in rows:
+        if row["scene"] is not None:
+            scene_frames[row["scene"]] = scene_frames.get(row["scene"], 0) + 1
+    return {
+        "frames": timeline["frames"],
+        "seconds_at_%s_fps" % int(MOVIE_FPS): round(timeline["frames"] / MOVIE_FPS, 1),
+        "viewport": list(timeline["viewport"]),
+        "keyframes": len(timeline["keyframes"]),
+        "scene_frames": scene_frames,
+        "hold_frames": len([row for row in rows if row["motion"] == "hold"]),
+        "transition_frames": len([row for row in rows if row["motion"] == "transition"]),
+        "rendered_frames": len([row for row in rows if row["render"]]),
+        "estimated_render_seconds": round(sum(costs), 1),
+        "shards": shards(rows, costs, number_of_shards),
+        "problems": timeline["problems"],
+    }
+
+
+def write_frame_table(rows, path):
+    with open(path, "w") as fh:
+        fh.write("FRAME\tSCENE\tSEGMENT\tMOTION\tCHANGED_SETTINGS\tRENDER\n")
+        for row in rows:
+            fh.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (row["frame"], row["scene"] or "", row["segment"], row["motion"],
+                                                   ",".join(row["changed_settings"]), "yes" if row["render"] else "no"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames, scenes and render cost of a movie script, without pymol")
+    parser.add_argument("movie_script")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seconds_per_megapixel", type=float, default=SECONDS_PER_MEGAPIXEL)
+    parser.add_argument("--frame_table", type=str, default="")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.movie_script) as fh:
+        timeline = parse_movie_script(fh)
+    rows = frame_table(timeline)
+    costs = render_cost(rows, timeline["viewport"], args.seconds_per_megapixel)
+    result = summary(timeline, rows, costs, max(1, args.shards))
+    if args.frame_table:
+        write_frame_table(rows, args.frame_table)
+
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+        return
+    print("%s frames, %s keyframes, viewport %sx%s" % (result["frames"], result["keyframes"],
+                                                      result["viewport"][0], result["viewport"][1]))
+    print("scenes: %s" % ", ".join("%s %s frames" % item for item in sorted(result["scene_frames"].items())))
+    print("%s hold and %s transition frames, %s frames to render, about %ss" % (
+        result["hold_frames"], result["transition_frames"], result["rendered_frames"],
+        result["estimated_render_seconds"]))
+    for shard in result["shards"]:
+        print("shard frames %s to %s, about %ss" % (shard["start"], shard["end"], shard["seconds"]))
+    for problem in result["problems"]:
+        print("problem: %s" % problem)
+
+
+if __name__ == "__main__":
+    main()
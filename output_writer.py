@@ -0,0 +1,261 @@
+'''
+Publishing of the movie maker output files.
+
+Every file is written to a temporary file next to its destination and renamed
+once complete, so a destination path never holds a partially written file and
+concurrent jobs never share a file. Slow writes, like pickling a large session,
+run in a background thread while the analysis continues. That only saves time
+for writes with analysis left after them, in movie_maker the preview session,
+written during the full run. The final session is submitted last, in single
+mode close() and in batch mode the flush after each element wait for it. At
+the end a manifest with size and sha256 checksum of every output can be written.
+
+Sessions can be compressed while they are pickled, without an intermediate
+uncompressed file:
+
+    gzip  *.pse.gz, loaded directly by recent pymol versions (1.8.4 and newer)
+    zstd  *.pse.zst, needs the optional zstandard package, smaller and faster,
+          but has to be decompressed (zstd -d) before loading into pymol
+
+Example usage:
+
+writer = OutputWriter()
+writer.submit_session("basic_movie.pse.gz", compression="gzip")
+...
+writer.close()
+writer.write_manifest("manifest.json")
+
+'''
+from __future__ import print_function
+from contextlib import contextmanager
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from pymol import cmd
+
+SESSION_COMPRESSIONS = ("none", "gzip", "zstd")
+
+# the umask can only be read by setting it, done once on import before the writer thread is started
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+@contextmanager
+def atomic_open(path, mode="w"):
+    '''
+    open a temporary file in the directory of path, which replaces path on success
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".%s." % os.path.basename(path), suffix=".tmp", dir=directory)
+    try:
+        # mkstemp creates the file readable by the owner only, use the mode of a plain open
+        os.chmod(temp_path, 0o666 & ~UMASK)
+        with os.fdopen(fd, mode) as fh:
+            yield fh
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.rename(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class CountingWriter(object):
+    '''
+    file-like wrapper counting the bytes written through it
+    '''
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.fh.write(data)
+
+
+@contextmanager
+def compressed_stream(fh, compression):
+    '''
+    wrap an opened binary file, data written to the yielded stream is compressed on the fly
+    '''
+    if compression == "gzip":
+        # empty filename, otherwise the name of the temporary file ends up in the gzip header
+        stream = gzip.GzipFile(filename="", mode="wb", fileobj=fh)
+        finish_stream = stream.close
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd session compression needs the zstandard package")
+        stream = zstandard.ZstdCompressor().stream_writer(fh)
+        # closing the stream writer would close fh as well, only finish the frame
+        finish_stream = lambda: stream.flush(zstandard.FLUSH_FRAME)
+    else:
+        yield fh
+        return
+    yield stream
+    finish_stream()
+
+
+def file_checksum(path, block_size=1 << 20):
+    '''
+    sha256 hex digest of the file at path
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        block = fh.read(block_size)
+        while block:
+            digest.update(block)
+            block = fh.read(block_size)
+    return digest.hexdigest()
+
+
+def get_session(partial=0):
+    '''
+    cmd.get_session, safe for scenes in sessions of versions before 1.76
+
+    to convert the scenes to the legacy format cmd.get_session stores a temporary scene, recalls every
+    scene and deletes the temporary scene again. pymol 3.2 renders the thumbnail of a stored or recalled
+    scene only at the next refresh, if the scene is deleted before, memory is freed twice and pymol
+    crashes at exit or on a later command. a refresh before the delete renders the pending thumbnails
+    '''
+    scene = cmd.scene
+
+    def scene_without_pending_thumbnail(key="auto", action="recall", *args, **kwargs):
+        if action in ("delete", "clear"):
+            cmd.refresh()
+        return scene(key, action, *args, **kwargs)
+
+    # cmd.get_session calls the scene function of the cmd module
+    cmd.scene = scene_without_pending_thumbnail
+    try:
+        return cmd.get_session(partial=partial)
+    finally:
+        cmd.scene = scene
+
+
+class OutputWriter(object):
+    '''
+    writes output files in a background thread and keeps track of them for the manifest
+    '''
+
+    def __init__(self, max_pending=4):
+        # bounded, so at most max_pending sessions are held in memory at once
+        self._queue = queue.Queue(max_pending)
+        self._errors = []
+        self.outputs = []
+        self.metrics = {}
+        self._thread = threading.Thread(target=self._run, name="output_writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                self._queue.task_done()
+                break
+            label, path, write_function = task
+            try:
+                start = time.time()
+                with atomic_open(path, "wb") as fh:
+                    write_function(fh)
+                self.register(label, path, seconds=time.time() - start)
+            except Exception as error:
+                self._errors.append((label, path, error))
+            self._queue.task_done()
+
+    def submit(self, label, path, write_function):
+        '''
+        write_function(fh) is called in the background thread with the opened temporary file
+        '''
+        self._queue.put((label, path, write_function))
+
+    def submit_session(self, path, label="session", compression="none"):
+        '''
+        take a snapshot of the current pymol session, pickling and writing happens in the background
+        '''
+        # same content as cmd.save for *.pse, the snapshot is independent of the further analysis
+        session = get_session()
+
+        def write_session(fh):
+            start = time.time()
+            with compressed_stream(fh, compression) as stream:
+                counter = CountingWriter(stream)
+                pickle.dump(session, counter, 1)
+            if compression != "none":
+                compressed_bytes = fh.tell()
+                self.metrics["%s_compression" % label] = {
+                    "method": compression,
+                    "uncompressed_bytes": counter.bytes_written,
+                    "compressed_bytes": compressed_bytes,
+                    "ratio": round(float(counter.bytes_written) / max(compressed_bytes, 1), 2),
+                    "seconds": round(time.time() - start, 3),
+                }
+
+        self.submit(label, path, write_session)
+
+    def register(self, label, path, seconds=0.0):
+        '''
+        record an output file written elsewhere for the manifest
+        '''
+        self.outputs.append({
+            "output": label,
+            "path": os.path.abspath(path),
+            "bytes": os.path.getsize(path),
+            "sha256": file_checksum(path),
+            "seconds": round(seconds, 3),
+        })
+
+    def flush(self):
+        '''
+        wait until all submitted writes are done, the writer stays open
+        returns the writes which failed since the last flush as (label, path, error), close does not raise for them
+        '''
+        self._queue.join()
+        errors, self._errors = self._errors, []
+        return errors
+
+    def discard(self, paths):
+        '''
+        remove written files and their manifest entries, call flush before to include pending writes
+        '''
+        paths = set([os.path.abspath(path) for path in paths if path])
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.outputs = [output for output in self.outputs if output["path"] not in paths]
+
+    def close(self):
+        '''
+        wait for all pending writes, raises if any of them failed
+        '''
+        self._queue.put(None)
+        self._thread.join()
+        if self._errors:
+            label, path, error = self._errors[0]
+            raise IOError("Could not write %s output to '%s': %s" % (label, path, error))
+
+    def write_manifest(self, path):
+        with atomic_open(path) as fh:
+            json.dump({"outputs": self.outputs, "metrics": self.metrics}, fh, indent=2, sort_keys=True)
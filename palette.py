@@ -0,0 +1,71 @@
+'''
+Color palettes and themes of the movie maker.
+
+Palette colors are registered once per process, instead of running
+colorblindfriendly.py with every job. Element colors of an object are applied
+with a single alter over color indices.
+
+A theme file is a json file, which can define new colors and assign colors to
+the roles used in the movie maker (protein_surface, protein_cartoon,
+binding_site, oxygen, nitrogen, interaction_polar, color_carbon, color_cofactor):
+
+{
+    "colors": {"teal_blue": [0.0, 0.5, 0.6]},
+    "roles": {"protein_surface": "teal_blue", "color_carbon": "cb_orange"}
+}
+
+'''
+import json
+
+from pymol import cmd
+
+import colorblindfriendly
+
+# hotpink rgb: 255, 105, 180
+HOT_PINK = (255.0/255.0, 105.0/255.0, 180.0/255.0)
+
+# names registered in this process, cmd.reinitialize() drops them from pymol
+_registered_colors = set()
+
+
+def register_colors(colors):
+    '''
+    set_color for every name in the dict colors, not registered in this process yet
+    '''
+    for name, rgb in sorted(colors.items()):
+        if name not in _registered_colors:
+            cmd.set_color(name, rgb)
+            _registered_colors.add(name)
+
+
+def register_palette():
+    '''
+    colorblind friendly palette and hot_pink
+    '''
+    if "cb_palette" not in _registered_colors:
+        colorblindfriendly.set_colors()
+        _registered_colors.add("cb_palette")
+    register_colors({"hot_pink": HOT_PINK})
+
+
+def load_theme(path):
+    '''
+    register the colors of a theme file, returns its role to color assignment
+    '''
+    with open(path) as fh:
+        theme = json.load(fh)
+    register_colors(dict((name, tuple(rgb)) for name, rgb in theme.get("colors", {}).items()))
+    return dict(theme.get("roles", {}))
+
+
+def color_by_element(selection, carbon, nitrogen=None, oxygen=None):
+    '''
+    color carbon, nitrogen and oxygen atoms of selection in one alter, other elements keep their color
+    '''
+    indices = {"C": cmd.get_color_index(carbon)}
+    if nitrogen:
+        indices["N"] = cmd.get_color_index(nitrogen)
+    if oxygen:
+        indices["O"] = cmd.get_color_index(oxygen)
+    cmd.alter(selection, "color = element_colors.get(elem, color)", space={"element_colors": indices})
+    cmd.recolor(selection)
@@ -12,13 +12,110 @@ Example usage:
 pairs = polarpairs('chain A', 'chain B')
 for p in pairs:
     dist = cmd.get_distance('(%s`%s)' % p[0], '(%s`%s)' % p[1])
-    print p, 'Distance: %.2f' % (dist)
+    print(p, 'Distance: %.2f' % (dist))
 
 '''
+from __future__ import print_function
 
 from pymol import cmd
 
-def polarpairs(sel1, sel2, cutoff=4.0, angle=63.0, name='', state=1, quiet=1):
+class InteractionContext(object):
+    '''
+    per structure cache for polarpairs
+
+    donor and acceptor flags are typed once per object and find_pairs results are
+    cached by (atoms of sel1, atoms of sel2, cutoff, angle, state). After
+    prime_table, all queries within a contact_table.ContactTable and up to its
+    radius are answered by filtering its pairs, other queries run find_pairs.
+    Call invalidate whenever atoms are removed or objects are replaced.
+    '''
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self._donors = {}
+        self._acceptors = {}
+        self._pairs = {}
+        self._tables = []
+
+    def _flags(self, flags, atoms, kind):
+        # type the atoms of every object only once
+        for model in set([atom[0] for atom in atoms]):
+            if model not in flags:
+                flags[model] = frozenset(cmd.index("%s and %s" % (model, kind)))
+        return set([atom for atom in atoms if atom in flags[atom[0]]])
+
+    def donors(self, atoms):
+        return self._flags(self._donors, atoms, "donors")
+
+    def acceptors(self, atoms):
+        return self._flags(self._acceptors, atoms, "acceptors")
+
+    def prime_table(self, table):
+        '''
+        answer queries by filtering the pairs of a ContactTable, also on copies of its atoms
+        '''
+        self._tables.append(table)
+
+    def _table_pairs(self, atoms1, atoms2, cutoff, angle, state):
+        keys = atom_keys(atoms1 | atoms2)
+        for table in self._tables:
+            if table.covers(keys.values(), cutoff, angle, state):
+                atoms_by_key1, atoms_by_key2 = {}, {}
+                for atom in atoms1:
+                    atoms_by_key1.setdefault(keys[atom], []).append(atom)
+                for atom in atoms2:
+                    atoms_by_key2.setdefault(keys[atom], []).append(atom)
+                return [(atom1, atom2) for key1, key2 in table.pairs_between(atoms_by_key1, atoms_by_key2, cutoff)
+                        for atom1 in atoms_by_key1[key1] for atom2 in atoms_by_key2[key2] if atom1 != atom2]
+        return None
+
+    def find_pairs(self, sel1, sel2, cutoff, angle, state):
+        '''
+        donor acceptor pairs between sel1 and sel2 in both directions, the sel1 atom first
+        '''
+        atoms1 = frozenset(cmd.index(sel1))
+        atoms2 = frozenset(cmd.index(sel2))
+        key = (atoms1, atoms2, cutoff, angle, state)
+        if key in self._pairs:
+            return self._pairs[key]
+
+        x = None
+        if self._tables:
+            x = self._table_pairs(atoms1, atoms2, cutoff, angle, state)
+
+        if x is None:
+            mode = 1 if angle > 0 else 0
+            x = []
+            # skip find_pairs if one side has no donors or acceptors, e.g. a water without hydrogens
+            if self.donors(atoms1) and self.acceptors(atoms2):
+                x += cmd.find_pairs('(%s) and donors' % sel1, '(%s) and acceptors' % sel2,
+                        state, state, cutoff=cutoff, mode=mode, angle=angle)
+            if self.acceptors(atoms1) and self.donors(atoms2):
+                x += cmd.find_pairs('(%s) and acceptors' % sel1, '(%s) and donors' % sel2,
+                        state, state, cutoff=cutoff, mode=mode, angle=angle)
+
+        x = sorted(set(x))
+        self._pairs[key] = x
+        return x
+
+
+def find_polar_pairs(sel1, sel2, cutoff, angle, state):
+    '''
+    uncached donor acceptor pairs between sel1 and sel2 in both directions, the sel1 atom first
+    '''
+    mode = 1 if angle > 0 else 0
+    x = cmd.find_pairs('(%s) and donors' % sel1, '(%s) and acceptors' % sel2,
+            state, state,
+            cutoff=cutoff, mode=mode, angle=angle) + \
+        cmd.find_pairs('(%s) and acceptors' % sel1, '(%s) and donors' % sel2,
+            state, state,
+            cutoff=cutoff, mode=mode, angle=angle)
+    return sorted(set(x))
+
+
+def polarpairs(sel1, sel2, cutoff=4.0, angle=63.0, name='', state=1, quiet=1, context=None):
     '''
 ARGUMENTS
 
@@ -31,6 +128,9 @@ ARGUMENTS
 
     name = string: If given, also create a distance object for visual representation
 
+    context = InteractionContext: If given, donor/acceptor typing and pairs are
+    cached and reused between calls
+
 SEE ALSO
 
     cmd.find_pairs, cmd.distance
@@ -41,17 +141,13 @@ SEE ALSO
     if angle == 'default':
         angle = cmd.get('h_bond_max_angle', cmd.get_object_list(sel1)[0])
     angle = float(angle)
-    mode = 1 if angle > 0 else 0
-    x = cmd.find_pairs('(%s) and donors' % sel1, '(%s) and acceptors' % sel2,
-            state, state,
-            cutoff=cutoff, mode=mode, angle=angle) + \
-        cmd.find_pairs('(%s) and acceptors' % sel1, '(%s) and donors' % sel2,
-            state, state,
-            cutoff=cutoff, mode=mode, angle=angle)
-    x = sorted(set(x))
+    if context is not None:
+        x = context.find_pairs(sel1, sel2, cutoff, angle, state)
+    else:
+        x = find_polar_pairs(sel1, sel2, cutoff, angle, state)
     if not quiet:
-        print 'Settings: cutoff=%.1fangstrom angle=%.1fdegree' % (cutoff, angle)
-        print 'Found %d polar contacts' % (len(x))
+        print('Settings: cutoff=%.1fangstrom angle=%.1fdegree' % (cutoff, angle))
+        print('Found %d polar contacts' % (len(x)))
     if len(name) > 0:
         for p in x:
             cmd.distance(name, '(%s`%s)' % p[0], '(%s`%s)' % p[1])
@@ -61,39 +157,62 @@ cmd.extend('polarpairs', polarpairs)
 
 
 
+def atom_selection(atoms):
+    '''
+    selection expression for a list of (object, index) tuples, one index list per object
+    '''
+    indices_by_object = {}
+    for model, index in atoms:
+        indices_by_object.setdefault(model, []).append(str(index))
+    return " or ".join(["(%s and index %s)" % (model, "+".join(indices))
+                        for model, indices in sorted(indices_by_object.items())])
+
+
+def residue_keys(atoms):
+    '''
+    map (object, index) tuples to their (resi, resn, chain) residue key with a single iterate
+    '''
+    keys = {}
+    if atoms:
+        cmd.iterate(atom_selection(atoms), 'keys[(model, index)] = (resi, resn, chain)', space={'keys': keys})
+    return keys
+
+
+def atom_keys(atoms):
+    '''
+    map (object, index) tuples to their (resi, resn, chain, name, alt) atom key with a single iterate
+    '''
+    keys = {}
+    if atoms:
+        cmd.iterate(atom_selection(atoms), 'keys[(model, index)] = (resi, resn, chain, name, alt)', space={'keys': keys})
+    return keys
+
+
 def polartuples(the_polarpairs, selection_name='polar_interaction', create_vis_and_selection=True):
     '''
     get list of polar interacting residues from polarpair
+
+    if create_vis_and_selection, one object named selection_name is created,
+    holding all interacting residues of the passed pairs
     '''
     polar_resn_tuples = []
     polar_resn_tuple_set = set([])
     # we are only interested in the residues in the binding site, polarpairs returns pairs
-    pairs = list(set([p[0] for p in the_polarpairs]))  # remove duplicate entries
-    for i, p in enumerate(pairs):
+    atoms = sorted(set([p[0] for p in the_polarpairs]))  # remove duplicate entries
+    keys = residue_keys(atoms)
+
+    #extract resn, resi, and chain identifier from binding site
+    for atom in atoms:
+        a_tuple = keys[atom]
+        #remove all duplicate entries
+        if a_tuple not in polar_resn_tuple_set:
+            polar_resn_tuples.append(a_tuple)
+            polar_resn_tuple_set.add(a_tuple)
+
+    if create_vis_and_selection and atoms:
         # create the object for our visualization
-        pair_name = selection_name + '_%s' % (i,)
-        sele_pair_name = "sele_" + selection_name + '_%s' % (i,)
-        cmd.select(sele_pair_name, "(%s`%s)" % p)
-        cmd.select(sele_pair_name, 'byres ' + sele_pair_name)
-        cmd.create(pair_name, sele_pair_name)
-        cmd.delete(sele_pair_name)
-
-        if create_vis_and_selection:
-            cmd.show('sticks', pair_name)
-        temp_model = cmd.get_model(pair_name)
-
-        #extract resn, resi, and chain identifier from binding site
-        for atom in temp_model.atom:
-            a_tuple = (atom.resi, atom.resn, atom.chain)
-            #remove all duplicate entries
-            if a_tuple not in polar_resn_tuple_set:
-                polar_resn_tuples.append(a_tuple)
-                polar_resn_tuple_set.add(a_tuple)
-                # print a_tuple
-                break
-        # print p, 'Distance: %.2f' % (dist)
-        if not create_vis_and_selection:
-            cmd.delete(pair_name)
+        cmd.create(selection_name, "byres (%s)" % atom_selection(atoms))
+        cmd.show('sticks', selection_name)
 
     return polar_resn_tuples
 
@@ -0,0 +1,302 @@
+'''
+Golden output regression suite of the movie maker.
+
+Runs the pipeline headless on a fixed corpus and compares canonicalized
+analysis results against snapshots: polar pairs, water bridges, halogen bonds,
+the lines of the polar interactions file, the objects shown when recalling
+every stored scene and the frames of the movie script. Atoms are identified by
+chain, resi, resn and name instead of object and index, distances and angles are
+rounded, so the snapshots do not depend on object names or the order in which
+pairs are found.
+
+Every corpus element is run once per engine. The reference engine queries
+find_pairs for every polarpairs call without any cache, the cached engine is
+the InteractionContext of production, answering from the contact table.
+Timings of the engines are reported side by side, a faster implementation is
+only adopted if its results match.
+
+With --batch the corpus is processed like by run_batch: the elements of an
+engine run one after the other in the same session, sharing one output writer
+which writes their sessions in the background, and each element also renders
+its preview. Besides matching the snapshots, the pymol process has to exit
+with 0, a crash at exit fails a batch in galaxy although all outputs exist.
+
+The corpus is a tab separated file, one element per line:
+identifier, pdb file, ligand name, chain[, further movie_maker arguments]
+MOVIEMAKERPATH and PYTHONPATH have to be set like in the movie_maker_*.sh scripts.
+
+The corpus in regression/ holds HIV-1 protease 1hpv with its inhibitor 478
+(chain A assigned to the hetero atoms, which have none in the original entry)
+at the default settings, at radius 5.0 with the halogen check and in pocket
+mode. 1hpv_chloro is a synthetic analogue, the aniline nitrogen N3 of 478 is
+replaced by a chlorine at the same position, which forms a halogen bond to
+ASP 30 of chain B (3.15 A, C-Cl...O 165 degrees), so the halogen bond and its
+scene F8 are compared. 3al1, the designed peptide alpha-1 with alternate
+locations, is run with the ligand ETA and the cofactor MPD (chain A assigned
+to the hetero atoms, which have none in the original entry). The snapshots
+were recorded with pymol 3.2, record them again after changing the pymol
+version.
+
+Example usage:
+
+# record the snapshots with the reference engine
+pymol -cq regression_suite.py -- --corpus regression/corpus.tsv --snapshots regression/snapshots --update
+# compare all engines against the snapshots
+pymol -cq regression_suite.py -- --corpus regression/corpus.tsv --snapshots regression/snapshots --report timings.json
+# compare a batch run of the corpus against the snapshots, the exit code has to be 0
+pymol -cq regression_suite.py -- --corpus regression/corpus.tsv --snapshots regression/snapshots --batch; echo $?
+
+'''
+from __future__ import print_function
+import argparse
+import json
+import os
+import re
+import shlex
+import shutil
+import tempfile
+import time
+
+from pymol import cmd
+
+from polar_pairs import InteractionContext, find_polar_pairs, atom_selection
+from output_writer import OutputWriter, atomic_open, get_session
+import movie_maker
+
+# decimals of distances and angles in the snapshots
+DISTANCE_DECIMALS = 2
+ANGLE_DECIMALS = 1
+
+
+class ReferenceContext(object):
+    '''
+    uncached stand-in for InteractionContext, every query runs find_pairs
+    '''
+
+    def invalidate(self):
+        pass
+
+    def prime_table(self, table):
+        pass
+
+    def find_pairs(self, sel1, sel2, cutoff, angle, state):
+        return find_polar_pairs(sel1, sel2, cutoff, angle, state)
+
+
+ENGINES = {"reference": ReferenceContext, "cached": InteractionContext}
+
+
+def read_corpus(corpus_filename):
+    '''
+    elements of the corpus: identifier, pdb file, ligand name, chain and further arguments
+    relative pdb paths are relative to the corpus file
+    '''
+    corpus_directory = os.path.dirname(os.path.abspath(corpus_filename))
+    with open(corpus_filename) as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if line.startswith("#") or len(fields) < 2:
+                continue
+            identifier, pdb_filename, ligand_name, chain_name, arguments = (fields + ["", "", ""])[:5]
+            yield (identifier, os.path.join(corpus_directory, pdb_filename), ligand_name, chain_name,
+                   shlex.split(arguments))
+
+
+def canonical_atoms(pairs):
+    '''
+    map the (object, index) tuples of pairs to chain, resi, resn and name with a single iterate
+    '''
+    atoms = sorted(set([atom for pair in pairs for atom in pair]))
+    keys = {}
+    if atoms:
+        cmd.iterate(atom_selection(atoms), 'keys[(model, index)] = (chain, resi, resn, name)', space={'keys': keys})
+    return keys
+
+
+def canonical_pairs(pairs):
+    keys = canonical_atoms(pairs)
+    return sorted([[keys[atom1], keys[atom2],
+                    round(cmd.get_distance('(%s`%s)' % atom1, '(%s`%s)' % atom2), DISTANCE_DECIMALS)]
+                   for atom1, atom2 in pairs])
+
+
+def movie_frames(movie_script_filename):
+    '''
+    number of frames and the frames at which scenes are stored in the movie script
+    '''
+    frames, scene_frames = 0, []
+    with open(movie_script_filename) as fh:
+        for line in fh:
+            match = re.match(r"mset 1x(\d+)", line)
+            if match:
+                frames = int(match.group(1))
+            match = re.match(r"mview store, (\d+), scene=(\w+)", line)
+            if match:
+                scene_frames.append([int(match.group(1)), match.group(2)])
+    return {"frames": frames, "scene_frames": scene_frames}
+
+
+def scene_objects(plan):
+    '''
+    objects shown by each scene of the plan after recalling it, an object is shown if it and all its groups are
+    enabled. scenes of earlier elements which are not part of the plan are skipped
+    '''
+    scenes = []
+    for scene in [scene for scene in cmd.get_scene_list() if scene in [entry["scene"] for entry in plan]]:
+        cmd.scene(scene, "recall", animate=0)
+        # session names: name, type, enabled, representations, object type, data, group
+        names = dict([(entry[0], (entry[2], entry[6])) for entry in get_session(partial=1)["names"] if entry])
+        shown = []
+        for name in cmd.get_names("objects", enabled_only=1):
+            group = names[name][1]
+            while group and names[group][0]:
+                group = names[group][1]
+            if not group:
+                shown.append(name)
+        scenes.append([scene, sorted(shown)])
+    return scenes
+
+
+def canonical_results(settings_dict):
+    '''
+    json compatible analysis results of a finished run_job, independent of object names and indices
+    '''
+    analysis = settings_dict["analysis"]
+    results = {
+        "polar_pairs": canonical_pairs(analysis["polar_pairs"]),
+        "polar_residues": sorted(analysis["polar_residues"]),
+        "water_bridges": sorted([[sorted(water["water"]), canonical_pairs(water["pairs"]),
+                                  sorted(water["partner_residues"])] for water in analysis["water_bridges"]]),
+        "halogen_bonds": sorted([[bond["halogen"], bond["partner"], round(bond["distance"], DISTANCE_DECIMALS),
+                                  round(bond["angle"], ANGLE_DECIMALS)] for bond in analysis["halogen_bonds"]]),
+        "polar_interaction_lines": settings_dict["polar_interaction_lines"],
+        "scenes": scene_objects(settings_dict["scene_plan"]),
+        "objects": sorted(cmd.get_names("objects")),
+        "movie": movie_frames(settings_dict["output_movie_script"]),
+    }
+    # tuples become lists, as they would after loading a snapshot
+    return json.loads(json.dumps(results))
+
+
+def job_options(identifier, pdb_filename, ligand_name, chain_name, arguments, output_dir, log_level, batch):
+    '''
+    commandline options of a corpus element with its outputs in output_dir,
+    in a batch named after the identifier like run_batch does, with a preview image
+    '''
+    argv = ["--input", pdb_filename, "--log_level", log_level,
+            "--output_session", os.path.join(output_dir, "session.pse"),
+            "--output_polar_interactions", os.path.join(output_dir, "polar_interactions.txt"),
+            "--output_movie_script", os.path.join(output_dir, "movie_script.pml")]
+    if ligand_name:
+        argv += ["--ligand_name", ligand_name]
+    if chain_name:
+        argv += ["--chain_name", chain_name]
+    commandline_options = movie_maker.parse_commandline_options(argv + arguments)
+    if batch:
+        commandline_options["batch_output_dir"] = output_dir
+        commandline_options = movie_maker.batch_element_options(commandline_options, identifier, pdb_filename,
+                                                                ligand_name, chain_name)
+    return commandline_options
+
+
+def run_element(pdb_filename, commandline_options, engine, writer, label_prefix=""):
+    '''
+    run the pipeline on one corpus element with the given engine, in the session of the previous element
+    returns the canonical results and the runtime in seconds
+    '''
+    movie_maker.reset_session()
+    start = time.time()
+    movie_maker.load_structure(pdb_filename)
+    settings_dict = movie_maker.run_job(commandline_options, writer, label_prefix=label_prefix,
+                                        interaction_context=ENGINES[engine]())
+    seconds = time.time() - start
+    return canonical_results(settings_dict), seconds
+
+
+def diff_results(expected, results):
+    '''
+    keys of the results which differ from the snapshot
+    '''
+    return sorted([key for key in set(expected) | set(results) if expected.get(key) != results.get(key)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare analysis results of the movie maker against snapshots")
+    parser.add_argument("--corpus", required=True)
+    parser.add_argument("--snapshots", required=True)
+    parser.add_argument("--update", action="store_true", help="record the snapshots with the reference engine")
+    parser.add_argument("--batch", action="store_true",
+                        help="process the corpus like a batch, all elements of an engine share one output writer")
+    parser.add_argument("--engines", type=str, default=",".join(sorted(ENGINES)))
+    parser.add_argument("--report", type=str, default="")
+    parser.add_argument("--log_level", type=str, default="quiet")
+    args = parser.parse_args()
+
+    engines = ["reference"] if args.update else args.engines.split(",")
+    for engine in engines:
+        if engine not in ENGINES:
+            parser.error("unknown engine '%s', choose from %s" % (engine, ", ".join(sorted(ENGINES))))
+    if not os.path.isdir(args.snapshots):
+        os.makedirs(args.snapshots)
+
+    # in a batch the elements of an engine share one writer and output directory, like in run_batch
+    batch_dirs, batch_writers = {}, {}
+    if args.batch:
+        for engine in engines:
+            batch_dirs[engine] = tempfile.mkdtemp(prefix="movie_maker_regression_batch_")
+            movie_maker.create_batch_directories(batch_dirs[engine])
+            batch_writers[engine] = OutputWriter()
+
+    report = []
+    for identifier, pdb_filename, ligand_name, chain_name, arguments in read_corpus(args.corpus):
+        snapshot_filename = os.path.join(args.snapshots, "%s.json" % re.sub(r"[^A-Za-z0-9_.-]", "_", identifier))
+        expected = None
+        if not args.update and os.path.exists(snapshot_filename):
+            with open(snapshot_filename) as fh:
+                expected = json.load(fh)
+
+        for engine in engines:
+            if args.batch:
+                commandline_options = job_options(identifier, pdb_filename, ligand_name, chain_name, arguments,
+                                                  batch_dirs[engine], args.log_level, True)
+                results, seconds = run_element(pdb_filename, commandline_options, engine, batch_writers[engine],
+                                               label_prefix="%s/" % identifier)
+            else:
+                output_dir = tempfile.mkdtemp(prefix="movie_maker_regression_")
+                try:
+                    commandline_options = job_options(identifier, pdb_filename, ligand_name, chain_name, arguments,
+                                                      output_dir, args.log_level, False)
+                    writer = OutputWriter()
+                    results, seconds = run_element(pdb_filename, commandline_options, engine, writer)
+                    writer.close()
+                finally:
+                    shutil.rmtree(output_dir)
+            if args.update:
+                with atomic_open(snapshot_filename) as fh:
+                    json.dump(results, fh, indent=1, sort_keys=True)
+                status, differences = "updated", []
+            elif expected is None:
+                status, differences = "no snapshot", []
+            else:
+                differences = diff_results(expected, results)
+                status = "DIFF" if differences else "ok"
+            report.append({"identifier": identifier, "engine": engine, "seconds": round(seconds, 3),
+                           "status": status, "differences": differences})
+            print("%-20s %-10s %8.2fs  %s %s" % (identifier, engine, seconds, status, " ".join(differences)))
+
+    for engine in batch_writers:
+        try:
+            batch_writers[engine].close()
+        finally:
+            shutil.rmtree(batch_dirs[engine])
+
+    if args.report:
+        with atomic_open(args.report) as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+
+    failed = [entry for entry in report if entry["status"] in ("DIFF", "no snapshot")]
+    if failed:
+        raise RuntimeError("%s of %s runs do not match their snapshot" % (len(failed), len(report)))
+
+
+main()
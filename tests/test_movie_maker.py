@@ -0,0 +1,99 @@
+'''
+End to end runs of movie_maker.py in pymol, like the movie_maker_*.sh scripts.
+
+pymol is the executable in the environment variable PYMOL or the pymol module
+of the python running the tests, without either the tests are skipped. The
+structure is 1hpv of the regression corpus.
+
+Example usage:
+
+PYMOL=/path/to/pymol python -m unittest discover tests
+'''
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+try:
+    import pymol
+except ImportError:
+    pymol = None
+
+MOVIE_MAKER_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.environ.get("PYMOL"):
+    PYMOL = [os.environ["PYMOL"]]
+elif pymol is not None:
+    PYMOL = [sys.executable, "-m", "pymol"]
+else:
+    PYMOL = None
+STRUCTURE = os.path.join(MOVIE_MAKER_PATH, "regression", "1hpv.pdb")
+
+
+def run_movie_maker(arguments, directory):
+    '''
+    run movie_maker.py with arguments in a new pymol process, returns its exit code
+    '''
+    environment = dict(os.environ)
+    environment["MOVIEMAKERPATH"] = MOVIE_MAKER_PATH + os.sep
+    environment["PYTHONPATH"] = os.pathsep.join([MOVIE_MAKER_PATH, environment.get("PYTHONPATH", "")])
+    with open(os.path.join(directory, "pymol.log"), "w") as log:
+        return subprocess.call(PYMOL + ["-cq", os.path.join(MOVIE_MAKER_PATH, "movie_maker.py"), "--"] + arguments,
+                               cwd=directory, env=environment, stdout=log, stderr=subprocess.STDOUT)
+
+
+@unittest.skipIf(not PYMOL, "pymol is not installed")
+class TwoPhaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="movie_maker_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def test_preview_and_full_run(self):
+        outputs = ["preview.png", "preview.pse", "session.pse", "polar_interactions.txt", "movie_script.pml",
+                   "manifest.json"]
+        exit_code = run_movie_maker(["--input", STRUCTURE, "--ligand_name", "478", "--chain_name", "A",
+                                     "--preview_image", self.path("preview.png"),
+                                     "--preview_session", self.path("preview.pse"),
+                                     "--output_session", self.path("session.pse"),
+                                     "--output_polar_interactions", self.path("polar_interactions.txt"),
+                                     "--output_movie_script", self.path("movie_script.pml"),
+                                     "--output_manifest", self.path("manifest.json")], self.directory)
+        # galaxy fails the job on any other exit code, even if all outputs were written
+        self.assertEqual(exit_code, 0)
+        for output in outputs:
+            self.assertTrue(os.path.getsize(self.path(output)), output)
+
+
+@unittest.skipIf(not PYMOL, "pymol is not installed")
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="movie_maker_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_several_elements(self):
+        identifiers = ["1hpv", "1hpv_second", "1hpv_third"]
+        with open(os.path.join(self.directory, "batch.tsv"), "w") as fh:
+            for identifier in identifiers:
+                fh.write("%s\t%s\t478\tA\n" % (identifier, STRUCTURE))
+        manifest = os.path.join(self.directory, "manifest.json")
+        exit_code = run_movie_maker(["--batch_manifest", "batch.tsv", "--batch_output_dir", "out",
+                                     "--output_manifest", manifest], self.directory)
+        self.assertEqual(exit_code, 0)
+        with open(manifest) as fh:
+            self.assertEqual(json.load(fh)["metrics"]["batch"], {"processed": identifiers, "failed": []})
+        for identifier in identifiers:
+            self.assertTrue(os.path.getsize(os.path.join(self.directory, "out", "sessions", identifier + ".pse")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+'''
+Checks of movie_timeline against the movie script of generate_movie_script.
+
+data/movie_script.pml was written by generate_movie_script with polar
+interactions and halogen bonds, the longest movie of 2100 frames. Where pymol
+is installed, python 2 or 3, the script is generated again and compared with
+the file, without pymol that test is skipped.
+
+Example usage:
+
+python -m unittest discover tests
+'''
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import movie_timeline
+
+MOVIE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "movie_script.pml")
+
+
+class MovieTimelineTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(MOVIE_SCRIPT) as fh:
+            self.timeline = movie_timeline.parse_movie_script(fh)
+        self.rows = movie_timeline.frame_table(self.timeline)
+        self.result = movie_timeline.summary(self.timeline, self.rows,
+                                             movie_timeline.render_cost(self.rows, self.timeline["viewport"]), 4)
+
+    def test_frames(self):
+        self.assertEqual(self.result["problems"], [])
+        self.assertEqual(self.result["frames"], 2100)
+        self.assertEqual(len(self.rows), 2100)
+        self.assertEqual(self.result["viewport"], [500, 500])
+
+    def test_motion(self):
+        # consecutive keyframes always differ in their view, only the last frame holds
+        self.assertEqual(self.result["transition_frames"], 2099)
+        self.assertEqual(self.result["hold_frames"], 1)
+        self.assertEqual(self.rows[-1]["motion"], "hold")
+
+    def test_scenes(self):
+        self.assertEqual(sorted(self.result["scene_frames"]), ["F1", "F2", "F3", "F5", "F6", "F7", "F8"])
+        self.assertEqual(sum(self.result["scene_frames"].values()), 2100)
+        self.assertEqual(self.rows[0]["scene"], "F1")
+        self.assertEqual(self.rows[-1]["scene"], "F8")
+
+    def test_fades(self):
+        # the fade from frame 301 to 302 changes the transparency in frame 302
+        self.assertEqual(self.rows[301]["changed_settings"], ["cartoon_transparency"])
+        self.assertEqual(self.rows[300]["changed_settings"], [])
+
+    def test_shards(self):
+        shards = self.result["shards"]
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(shards[0]["start"], 1)
+        self.assertEqual(shards[-1]["end"], 2100)
+        for shard, next_shard in zip(shards, shards[1:]):
+            self.assertEqual(shard["end"] + 1, next_shard["start"])
+
+    def test_problems(self):
+        timeline = movie_timeline.parse_movie_script(["mview store, 5, scene=F1\n", "mset 1x3\n"])
+        self.assertEqual(timeline["frames"], 3)
+        self.assertTrue([problem for problem in timeline["problems"] if "outside of frames" in problem])
+        self.assertTrue([problem for problem in timeline["problems"] if "reinterpolate" in problem])
+
+    def test_generated_script(self):
+        # movie_maker runs fade_movie.py and polar_pairs.py from MOVIEMAKERPATH on import
+        os.environ.setdefault("MOVIEMAKERPATH", os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep)
+        try:
+            import movie_maker
+        except ImportError:
+            self.skipTest("pymol is not installed")
+        directory = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(directory, "movie_script.pml")
+            movie_maker.generate_movie_script({"check_halogen_interaction": True,
+                                               "halogen_bond_selections": ["halogen_bond_0"]}, filepath)
+            with open(filepath) as fh, open(MOVIE_SCRIPT) as expected:
+                self.assertEqual(fh.read(), expected.read())
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()